@@ -0,0 +1,4925 @@
+# MIT License
+#
+# Copyright (c) 2021 VacuityBox
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# SPDX-License-Identifier: MIT
+
+import argparse
+import ast
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import copy
+import datetime
+import fnmatch
+import functools
+import hashlib
+import io
+import json
+import marshal
+import os
+import pathlib
+import pprint
+import re
+import select
+import shlex
+import shutil
+import signal
+import socket
+import socketserver
+import string
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import urllib.parse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Abbreviated hash length used when git can't be asked for its own.
+DEFAULT_ABBREV_LENGTH = 7
+
+# ============================================================================ #
+# Frontends definition buffer.
+# ============================================================================ #
+
+# $$_BUILDER_FRONTENDS_DESC_START_HERE_$$ #
+FRONTENDS_DESC = R'''
+{
+    "git": {
+        "version": "1.0.0",
+        "exe": "git",
+        "get.repo": {
+            "cmd": "git rev-parse --git-dir",
+            "ret_codes": [0]
+        },
+        "coproc": {
+            "cmd": "git cat-file --batch-check",
+            "restarts": 2
+        },
+        "get.commit_hash": {
+            "cmd": "git rev-parse HEAD",
+            "ret_codes": [0],
+            "batch": "HEAD"
+        },
+        "get.short_hash":  {
+            "cmd": "git rev-parse --short HEAD",
+            "ret_codes": [0],
+            "batch": "HEAD",
+            "batch_abbrev": true
+        },
+        "get.tag":  {
+            "cmd": "git describe --tags --abbrev=0 --exact-match",
+            "ret_codes": [0, 128]
+        },
+        "get.branch": {
+            "cmd": "git rev-parse --abbrev-ref HEAD",
+            "ret_codes": [0]
+        },
+        "get.commit_count": {
+            "cmd": "git rev-list --count HEAD",
+            "ret_codes": [0]
+        },
+        "get.path_log": {
+            "cmd": "git log --name-only --no-renames --format=commit:%H {range}",
+            "ret_codes": [0],
+            "timeout": 60
+        },
+        "get.is_ancestor": {
+            "cmd": "git merge-base --is-ancestor {old} {new}",
+            "ret_codes": [0, 1]
+        },
+        "get.gitlinks": {
+            "cmd": "git ls-files --stage -- {paths}",
+            "ret_codes": [0]
+        },
+        "get.tag_peel": {
+            "cmd": "git for-each-ref \"--format=%(objectname) %(*objectname) %(refname)\" refs/tags",
+            "ret_codes": [0]
+        },
+        "get.first_parents": {
+            "cmd": "git rev-list --first-parent HEAD",
+            "ret_codes": [0],
+            "timeout": 60
+        },
+        "get.dirty": {
+            "cmd": "git diff --quiet HEAD --",
+            "ret_codes": [0, 1]
+        }
+    },
+    "env": {
+        "version": "1.0.0",
+        "type": "env",
+        "fallback": "git",
+        "short_hash_length": 7,
+        "vars": {
+            "commit_hash":  ["GITHUB_SHA", "CI_COMMIT_SHA", "BUILD_VCS_NUMBER", "GIT_COMMIT"],
+            "short_hash":   ["CI_COMMIT_SHORT_SHA"],
+            "branch":       ["CI_COMMIT_BRANCH", "GITHUB_HEAD_REF", "CI_COMMIT_REF_NAME", "GIT_BRANCH"],
+            "tag":          ["CI_COMMIT_TAG"],
+            "commit_count": ["VERHEL_COMMIT_COUNT"]
+        }
+    }
+}
+'''
+# $$_BUILDER_FRONTENDS_DESC_END_HERE_$$ #
+
+# ============================================================================ #
+# Backends definition buffer.
+# ============================================================================ #
+
+# $$_BUILDER_BACKENDS_DESC_START_HERE_$$ #
+BACKENDS_DESC = R'''
+{
+    "cpp": {
+        "version": "1.0.0",
+        "source.begin":   "#pragma once\n\nnamespace verhel {\n\n",
+        "source.comment": "//",
+        "source.end":     "\n} // namespace verhel\n",
+        "format.bool":    "    inline constexpr auto {0} = {1};\n",
+        "format.number":  "    inline constexpr auto {0} = {1};\n",
+        "format.string":  "    inline constexpr auto {0} = \"{1!u}\";\n",
+        "format.var":     "{0!u}",
+        "var_map": [
+            { "version.major":       "VERSION_MAJOR      " },
+            { "version.minor":       "VERSION_MINOR      " },
+            { "version.patch":       "VERSION_PATCH      " },
+            { "version.pre_release": "VERSION_PRE_RELEASE" },
+            { "version.string":      "VERSION_STRING     " },
+            { "project.name":        "PROJECT_NAME       " },
+            { "project.author":      "PROJECT_AUTHOR     " },
+            { "project.license":     "PROJECT_LICENSE    " },
+            { "project.copyright":   "PROJECT_COPYRIGHT  " },
+            { "project.description": "PROJECT_DESCRIPTION" },
+            { "project.directory":   "PROJECT_DIRECTORY  " },
+            { "project.path":        "PROJECT_PATH       " },
+            { "build.date":          "BUILD_DATE         " },
+            { "build.time":          "BUILD_TIME         " },
+            { "vcs.name":            "VCS_NAME           " },
+            { "vcs.commit_hash":     "VCS_COMMIT_HASH    " },
+            { "vcs.short_hash":      "VCS_SHORT_HASH     " },
+            { "vcs.tag":             "VCS_TAG            " },
+            { "vcs.branch":          "VCS_BRANCH         " },
+            { "vcs.commit_count":    "VCS_COMMIT_COUNT   " }
+        ]
+    }
+}
+'''
+# $$_BUILDER_BACKENDS_DESC_END_HERE_$$ #
+
+# ============================================================================ #
+# Exit codes
+# ============================================================================ #
+class ExitCodes:
+    SUCCESS                       = 0
+    FAILED_TO_LOAD_PROJECTS       = 1
+    FAILED_TO_SAVE_PROJECTS       = 2
+    FAILED_TO_LOAD_FRONTENDS      = 3
+    FAILED_TO_LOAD_BACKENDS       = 4
+    PROJECT_DOESNT_EXISTS         = 5
+    PROJECT_ALREADY_EXISTS        = 6
+    PROJECT_VALIDATION_FAILED     = 7
+    FRONTEND_DOESNT_EXISTS        = 8
+    BACKEND_DOESNT_EXISTS         = 9
+    FAILED_TO_ENTER_PROJECT_DIR   = 10
+    VERSION_CONTROL_NOT_INSTALLED = 11
+    REPO_DOESNT_EXISTS            = 12
+    INVALID_KEY                   = 13
+    INVALID_VALUE                 = 14
+    VERSION_IS_NULL               = 15
+    SERVER_FAILED                 = 16
+    INVALID_REQUEST               = 17
+    FAILED_TO_LOAD_SNAPSHOT       = 18
+    FAILED_TO_SAVE_SNAPSHOT       = 19
+    LOCK_TIMEOUT                  = 20
+    INVALID_CATALOG               = 21
+    WORKER_FAILED                 = 22
+    FAILED_TO_INSTALL_HOOKS       = 23
+
+# ============================================================================ #
+# Logger
+# ============================================================================ #
+USE_COLOR_OUTPUT = True
+
+class LogType:
+    DEBUG   = 0
+    INFO    = 1
+    SUCCESS = 2
+    WARNING = 3
+    ERROR   = 4
+    FATAL   = 5
+
+    @staticmethod
+    def to_str(log_type):
+        if log_type == LogType.DEBUG:
+            return "DEBUG"
+        elif log_type == LogType.INFO:
+            return "INFO"
+        elif log_type == LogType.SUCCESS:
+            return "SUCCESS"
+        elif log_type == LogType.WARNING:
+            return "WARNING"
+        elif log_type == LogType.ERROR:
+            return "ERROR"
+        elif log_type == LogType.FATAL:
+            return "FATAL"
+        else:
+            return ""
+
+class LogBackend:
+    def __init__(self):
+        self.log_level = LogType.INFO
+
+    def log(self, log_type, time, message):
+        raise NotImplementedError()
+
+    def set_log_level(self, log_level):
+        self.log_level = log_level
+
+class LogBackendConsole(LogBackend):
+    def log(self, log_type, time, message):
+        if self.log_level > log_type:
+            return
+
+        color = ""
+        reset_color = ""
+
+        global USE_COLOR_OUTPUT
+        if USE_COLOR_OUTPUT:
+            color = "\033[39m"
+            reset_color = "\033[0m"
+            if log_type == LogType.DEBUG:
+                color = "\033[34m"
+            elif log_type == LogType.INFO:
+                color = "\033[39m"
+            elif log_type == LogType.SUCCESS:
+                color = "\033[32m"
+            elif log_type == LogType.WARNING:
+                color = "\033[33m"
+            elif log_type == LogType.ERROR:
+                color = "\033[31m"
+            elif log_type == LogType.FATAL:
+                color = "\033[101m"
+
+        print("{}[{:8.3f}] {}{}".format(color, time, message, reset_color))
+
+class LogBackendFile(LogBackend):
+    def __init__(self, file_name):
+        super().__init__()
+        self.file = None
+
+        try:
+            self.file = open(file_name, "w")
+        except:
+            pass
+        else:
+            #self.file.write("---- log started ----\n")
+            pass
+
+    def __del__(self):
+        if self.file is not None:
+            #self.file.write("---- log closed ----\n")
+            self.file.close()
+
+    def log(self, log_type, time, message):
+        if self.log_level > log_type:
+            return
+
+        if self.file is not None:
+            date = datetime.datetime.now().strftime("%Y-%m-%d")
+            time = datetime.datetime.now().strftime("%H:%M:%S")
+            log_type_str = LogType.to_str(log_type)
+            self.file.write("{} {} [{:7}] {}\n".format(date, time, log_type_str, message))
+        
+class Log:
+    __backends   = []
+    __start_time = time.time()
+
+    @staticmethod
+    def add_backend(backend: LogBackend):
+        Log.__backends.append(backend)
+
+    @staticmethod
+    def __log(log_type, message):
+        from_start = time.time() - Log.__start_time
+        for backends in Log.__backends:
+            backends.log(log_type, from_start, message)
+
+    @staticmethod
+    def debug(message):
+        Log.__log(LogType.DEBUG, message)
+
+    @staticmethod
+    def info(message):
+        Log.__log(LogType.INFO, message)
+
+    @staticmethod
+    def success(message):
+        Log.__log(LogType.SUCCESS, message)
+
+    @staticmethod
+    def warn(message):
+        Log.__log(LogType.WARNING, message)
+
+    @staticmethod
+    def error(message):
+        Log.__log(LogType.ERROR, message)
+
+    @staticmethod
+    def fatal(message):
+        Log.__log(LogType.FATAL, message)
+
+# ============================================================================ #
+# File helpers
+# ============================================================================ #
+class Catalog(collections.abc.Mapping):
+    # Frontends or backends by name, entry is decoded and validated on first
+    # access, so only entries that are used are paid for.
+    def __init__(self, names, load_entry):
+        self.names = names
+        self.load_entry = load_entry
+        self.entries = {}
+
+    def __getitem__(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            if name not in self.names:
+                raise KeyError(name)
+            entry = self.load_entry(name)
+            self.entries[name] = entry
+        return entry
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+class FileLock:
+    # Advisory lock using flock, no-op on platforms without fcntl.
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file = None
+
+    def acquire(self, timeout=None):
+        # Returns True if lock was free, False if we had to wait for it.
+        pathlib.Path(self.file_name).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.file_name, "a+", encoding="utf-8")
+        if fcntl is None:
+            return True
+
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            return True
+
+        if timeout is None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+            return False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(0.01)
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self.file.close()
+                    self.file = None
+                    raise TimeoutError("timed out waiting for lock '{}'".format(self.file_name))
+            else:
+                return False
+
+    def release(self):
+        if self.file is not None:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def write(self, buffer):
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(buffer)
+        self.file.flush()
+
+class Coprocess:
+    # Keeps batch process running (e.g. 'git cat-file --batch-check'),
+    # every query is one line and every answer is one line.
+    # Process is restarted when it dies or doesn't answer in time.
+    def __init__(self, cmd, cwd, max_restarts, on_start=None):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.max_restarts = max_restarts
+        self.on_start = on_start
+        self.restarts = 0
+        self.proc = None
+        self.last_used = time.monotonic()
+
+    def start(self):
+        Log.info("starting coprocess '{}'".format(self.cmd))
+        if self.on_start is not None:
+            self.on_start()
+        self.proc = subprocess.Popen(
+            shlex.split(self.cmd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.cwd,
+            encoding="utf-8"
+            )
+
+    def close(self):
+        if self.proc is not None:
+            with contextlib.suppress(OSError):
+                self.proc.stdin.close()
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def read_line(self, timeout):
+        if os.name == "posix":
+            readable, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            if len(readable) == 0:
+                raise TimeoutError("coprocess '{}' didn't answer in time".format(self.cmd))
+
+        line = self.proc.stdout.readline()
+        if len(line) == 0:
+            raise OSError("coprocess '{}' exited".format(self.cmd))
+        return line.rstrip("\n")
+
+    def query(self, line, timeout):
+        if "\n" in line:
+            raise ValueError("query can't contain new line")
+
+        self.last_used = time.monotonic()
+        while True:
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    self.start()
+                self.proc.stdin.write(line + "\n")
+                self.proc.stdin.flush()
+                answer = self.read_line(timeout)
+            except OSError as e:
+                self.close()
+                if self.restarts >= self.max_restarts:
+                    raise Exception("coprocess '{}' failed: {}".format(self.cmd, e))
+                self.restarts += 1
+                Log.warn("{}, restarting ({}/{})".format(e, self.restarts, self.max_restarts))
+            else:
+                # Only failures in a row count, long running server would
+                # give up on transient failures otherwise.
+                self.restarts = 0
+                return answer
+
+def entry_script():
+    # Script processes are started with, thin launcher next to this module
+    # if present (see verhel.py), otherwise this module as standalone script.
+    launcher = os.path.join(os.path.dirname(os.path.abspath(__file__)), "verhel.py")
+    return launcher if os.path.exists(launcher) else os.path.abspath(__file__)
+
+def write_file_atomic(file_name, buffer):
+    # Write to temporary file in the same directory and rename it over
+    # the target, so readers never see partially written file. Symlinks
+    # are resolved, so the link is kept and its target is replaced.
+    path = pathlib.Path(file_name).resolve()
+    tmp_path = temporary_file_name(path)
+    try:
+        if type(buffer) is bytes:
+            f = open(tmp_path, "wb")
+        else:
+            f = open(tmp_path, "w", encoding="utf-8")
+        with f:
+            bytes_write = f.write(buffer)
+        os.replace(tmp_path, path)
+    except:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+    return bytes_write
+
+# Files smaller than this are decoded whole by json.load, which is several
+# times faster than iter_json_object and holds at most few MiB. Larger
+# files are streamed entry by entry.
+JSON_STREAM_THRESHOLD = 8 << 20
+
+def iter_json_object(f, object_pairs_hook=dict, chunk_size=1 << 16):
+    # Yields (key, value) pairs of top level json object read from text
+    # file in chunks, so the first entry is available before the rest is
+    # read and only the entry being decoded is held in memory. Used for
+    # files of JSON_STREAM_THRESHOLD size and larger.
+    decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+    whitespace = re.compile(r"[ \t\n\r]*")
+    buffer = ""
+    index = 0
+    offset = 0
+    eof = False
+
+    def fill():
+        # Drops decoded part of buffer and appends next chunk, False at
+        # the end of file.
+        nonlocal buffer, index, offset, eof
+        chunk = f.read(chunk_size)
+        buffer = buffer[index:] + chunk
+        offset += index
+        index = 0
+        eof = len(chunk) == 0
+        return not eof
+
+    def skip():
+        # Next character after whitespace, empty at the end of file.
+        nonlocal index
+        while True:
+            index = whitespace.match(buffer, index).end()
+            if index < len(buffer) or not fill():
+                return buffer[index:index + 1]
+
+    def decode(decode_fn):
+        # Value cut by the end of buffer fails to decode or may continue
+        # (number cut as '1.' or '1e+' decodes as 1), so it's decoded
+        # again with next chunk.
+        nonlocal index
+        while True:
+            try:
+                value, end = decode_fn(buffer, index)
+            except ValueError:
+                if not fill():
+                    raise
+                continue
+            if len(buffer) - end < 3 and not eof:
+                fill()
+                continue
+            index = end
+            return value
+
+    def error(expected):
+        return ValueError("expected {} at {}".format(expected, offset + index))
+
+    if skip() != "{":
+        raise error("object")
+    index += 1
+
+    if skip() == "}":
+        index += 1
+    else:
+        while True:
+            if skip() != "\"":
+                raise error("key")
+            key = decode(lambda b, i: json.decoder.scanstring(b, i + 1))
+            if skip() != ":":
+                raise error("':'")
+            index += 1
+            skip()
+            value = decode(decoder.raw_decode)
+            yield key, value
+
+            separator = skip()
+            if separator == "}":
+                index += 1
+                break
+            if separator != ",":
+                raise error("',' or '}'")
+            index += 1
+
+    if skip() != "":
+        raise ValueError("extra data at {}".format(offset + index))
+
+def temporary_file_name(path):
+    # Unique per process and thread, so concurrent writers don't collide.
+    return path.parent / ".{}.{}.{}.tmp".format(path.name, os.getpid(), threading.get_ident())
+
+def write_files_atomic(files, jobs=1, fsync=False):
+    # Write (file name, buffer) pairs through thread pool. Files with
+    # unchanged content are not touched. Changed files are written to
+    # temporary files, which are renamed over targets once all are written.
+    # With fsync, each temporary file is synced before renaming and each
+    # directory is synced once after. Text is written with platform line
+    # endings and compared as bytes, so change of line endings is written.
+    # Returns list of (bytes written, None if unchanged or exception, seconds).
+    def stage(file_name, buffer):
+        start = time.perf_counter()
+        path = pathlib.Path(file_name)
+        if type(buffer) is not bytes:
+            buffer = buffer.replace("\n", os.linesep).encode("utf-8")
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(buffer) + 1) == buffer:
+                    return None, None, time.perf_counter() - start
+        except OSError:
+            pass
+
+        tmp_path = temporary_file_name(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                bytes_write = f.write(buffer)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError as e:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            return e, None, time.perf_counter() - start
+
+        return bytes_write, tmp_path, time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(files) or 1))) as pool:
+        staged = list(pool.map(lambda item: stage(*item), files))
+
+    results = []
+    directories = set()
+    for (file_name, _), (result, tmp_path, seconds) in zip(files, staged):
+        if tmp_path is not None:
+            try:
+                os.replace(tmp_path, file_name)
+            except OSError as e:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+                result = e
+            else:
+                directories.add(pathlib.Path(file_name).parent)
+        results.append((result, seconds))
+
+    # Directory entries of renamed files, posix only.
+    if fsync and os.name == "posix":
+        for directory in directories:
+            with contextlib.suppress(OSError):
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    return results
+
+# ============================================================================ #
+# Templates
+# ============================================================================ #
+# Template backend syntax:
+#   {{ field }}, {{ field|upper }}       value of cooked field, filters are
+#                                        upper, lower and json
+#   {% if [not] field %}, {% elif [not] field %}, {% else %}, {% endif %}
+#   {% for key, value in fields("vcs.") %}, {% endfor %}
+#                                        cooked fields with prefix, inside loop
+#                                        are loop.index, loop.first, loop.last
+#   {# comment #}
+# Block tags and comments alone on line don't leave empty line.
+TEMPLATE_FORMAT  = 1
+TEMPLATE_FILTERS = ["upper", "lower", "json"]
+
+class TemplateError(Exception):
+    pass
+
+def template_str(value):
+    if value is None:
+        return ""
+    elif type(value) is bool:
+        return str(value).lower()
+    else:
+        return str(value)
+
+def template_filter(value, name):
+    if name == "upper":
+        return template_str(value).upper()
+    elif name == "lower":
+        return template_str(value).lower()
+    else:
+        return json.dumps(value)
+
+def compile_template(text, name="<template>"):
+    # Compile template to code object defining render(_get, _items), where
+    # _get returns value of field and _items (name, value) pairs of fields
+    # with prefix. Returns code and fields referenced by template, prefix
+    # of loop over fields ends with '*'.
+    tokens = re.split(r"({{.*?}}|{%.*?%}|{#.*?#})", text, flags=re.S)
+
+    token_lines = []
+    line_no = 1
+    for token in tokens:
+        token_lines.append(line_no)
+        line_no += token.count("\n")
+
+    # Remove lines with only block tag or comment.
+    for i in range(1, len(tokens), 2):
+        if tokens[i].startswith("{{"):
+            continue
+
+        before = tokens[i - 1]
+        after = tokens[i + 1]
+        line_start = before.rfind("\n") + 1
+        if before[line_start:].strip(" \t") != "":
+            continue
+
+        for newline in ["\r\n", "\n"]:
+            if after.startswith(newline):
+                tokens[i - 1] = before[:line_start]
+                tokens[i + 1] = after[len(newline):]
+                break
+        else:
+            if i + 1 == len(tokens) - 1 and after == "":
+                tokens[i - 1] = before[:line_start]
+
+    lines = ["def render(_get, _items):", "    _out = []", "    _w = _out.append"]
+    fields = []
+    stack = []  # Open blocks [kind, loop number or else seen, loop variables].
+    loops = 0
+
+    def fail(message):
+        raise TemplateError("{}:{}: {}".format(name, line_no, message))
+
+    def emit(code):
+        lines.append("    " * (len(stack) + 1) + code)
+
+    def ref(field):
+        if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.]*", field) is None:
+            fail("invalid field name '{}'".format(field))
+
+        loop_blocks = [block for block in stack if block[0] == "for"]
+        if field.startswith("loop.") and len(loop_blocks) > 0:
+            number = loop_blocks[-1][1]
+            attribute = field[len("loop."):]
+            if attribute == "index":
+                return "(_i{} + 1)".format(number)
+            elif attribute == "first":
+                return "(_i{} == 0)".format(number)
+            elif attribute == "last":
+                return "(_i{0} == len(_l{0}) - 1)".format(number)
+            fail("unknown loop attribute '{}'".format(attribute))
+
+        for block in reversed(loop_blocks):
+            if field in block[2]:
+                return "_v{}_{}".format(block[1], field)
+
+        if field not in fields:
+            fields.append(field)
+        return "_get({!r})".format(field)
+
+    def condition(source):
+        words = source.split()
+        if len(words) == 2 and words[0] == "not":
+            return "not " + ref(words[1])
+        elif len(words) == 1:
+            return ref(words[0])
+        fail("invalid condition '{}'".format(source))
+
+    for i, token in enumerate(tokens):
+        line_no = token_lines[i]
+        if i % 2 == 0:
+            if len(token) > 0:
+                emit("_w({!r})".format(token))
+        elif token.startswith("{#"):
+            pass
+        elif token.startswith("{{"):
+            parts = [part.strip() for part in token[2:-2].split("|")]
+            value = ref(parts[0])
+            for filter_name in parts[1:]:
+                if filter_name not in TEMPLATE_FILTERS:
+                    fail("unknown filter '{}'".format(filter_name))
+                value = "_filter({}, {!r})".format(value, filter_name)
+            emit("_w(_str({}))".format(value))
+        else:
+            statement = token[2:-2].strip()
+            keyword = statement.split(" ", 1)[0]
+            rest = statement[len(keyword):].strip()
+            if keyword == "if":
+                emit("if {}:".format(condition(rest)))
+                stack.append(["if", False, None])
+                emit("pass")
+            elif keyword in ["elif", "else"]:
+                if len(stack) == 0 or stack[-1][0] != "if" or stack[-1][1]:
+                    fail("unexpected '{}'".format(keyword))
+                stack.pop()
+                if keyword == "elif":
+                    emit("elif {}:".format(condition(rest)))
+                    stack.append(["if", False, None])
+                else:
+                    emit("else:")
+                    stack.append(["if", True, None])
+                emit("pass")
+            elif keyword == "for":
+                match = re.fullmatch(r"(\w+)\s*,\s*(\w+)\s+in\s+fields(?:\(\s*([\"'])(.*?)\3\s*\))?", rest)
+                if match is None:
+                    fail("invalid loop '{}', expected 'key, value in fields(\"prefix\")'".format(rest))
+                loops += 1
+                prefix = match.group(4) or ""
+                if prefix + "*" not in fields:
+                    fields.append(prefix + "*")
+                emit("_l{} = _items({!r})".format(loops, prefix))
+                emit("for _i{0}, (_v{0}_{1}, _v{0}_{2}) in enumerate(_l{0}):".format(loops, match.group(1), match.group(2)))
+                stack.append(["for", loops, [match.group(1), match.group(2)]])
+                emit("pass")
+            elif keyword in ["endif", "endfor"]:
+                if len(stack) == 0 or "end" + stack[-1][0] != keyword:
+                    fail("unexpected '{}'".format(keyword))
+                stack.pop()
+            else:
+                fail("unknown statement '{}'".format(keyword))
+
+    if len(stack) > 0:
+        fail("'{}' is not closed".format(stack[-1][0]))
+    lines.append("    return ''.join(_out)")
+
+    try:
+        code = compile("\n".join(lines) + "\n", name, "exec")
+    except SyntaxError as e:
+        fail("{}".format(e))
+
+    return code, fields
+
+# ============================================================================ #
+# Metrics
+# ============================================================================ #
+METRICS_HELP = {
+    "verhel_phase_duration_seconds":       ("histogram", "Duration of generate phases."),
+    "verhel_run_cmd_spawns_total":         ("counter",   "Number of processes spawned to run commands."),
+    "verhel_vcs_command_duration_seconds": ("histogram", "Latency of vcs commands by frontend command name."),
+    "verhel_output_bytes_written_total":   ("counter",   "Bytes written to outputs by backend."),
+    "verhel_outputs_written_total":        ("counter",   "Outputs written by backend."),
+    "verhel_outputs_unchanged_total":      ("counter",   "Outputs skipped as unchanged by backend."),
+    "verhel_outputs_failed_total":         ("counter",   "Outputs failed to write by backend."),
+    "verhel_cache_hits_total":             ("counter",   "Cache hits by cache."),
+    "verhel_cache_misses_total":           ("counter",   "Cache misses by cache."),
+    "verhel_projects_total":               ("counter",   "Generated projects by result."),
+}
+
+class Metrics:
+    # Counters and histograms of single run, rendered in Prometheus text
+    # format. Commands can be run from worker threads, so it's locked.
+    BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+    UNLABELED_COUNTERS = ["verhel_run_cmd_spawns_total"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Counters without labels are reported even if nothing was counted.
+        self.counters = dict(((name, ()), 0) for name in self.UNLABELED_COUNTERS)
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for index, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def cache(self, cache_name, hit):
+        self.inc("verhel_cache_hits_total" if hit else "verhel_cache_misses_total", cache=cache_name)
+
+    @contextlib.contextmanager
+    def phase(self, phase_name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("verhel_phase_duration_seconds", time.perf_counter() - start, phase=phase_name)
+
+    def render(self):
+        def format_labels(labels):
+            if len(labels) == 0:
+                return ""
+            return "{{{}}}".format(",".join('{}="{}"'.format(name, str(value)
+                .replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for name, value in labels))
+
+        def format_value(value):
+            return repr(float(value)) if type(value) is float else str(value)
+
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text) in METRICS_HELP.items():
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+                if metric_type == "counter":
+                    for (key_name, labels), value in sorted(self.counters.items()):
+                        if key_name == name:
+                            lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+                else:
+                    for (key_name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                        if key_name != name:
+                            continue
+                        for bound, bucket_count in zip(self.BUCKETS, buckets):
+                            lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", repr(float(bound))),)), bucket_count))
+                        lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", "+Inf"),)), count))
+                        lines.append("{}_sum{} {}".format(name, format_labels(labels), format_value(total)))
+                        lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+
+        return "\n".join(lines) + "\n"
+
+# ============================================================================ #
+# Records
+# ============================================================================ #
+class SparseRecord:
+    # Dict-like record, values of known keys are kept in slots and other
+    # keys in extra dict. Null values are not stored, so null and missing
+    # known key is the same and only non-null values are serialized.
+    __slots__ = ["_extra"]
+    KEYS = {}
+
+    def __init__(self, pairs=()):
+        self._extra = None
+        if hasattr(pairs, "items"):
+            pairs = pairs.items()
+        for key, value in pairs:
+            self[key] = value
+
+    def __getitem__(self, key):
+        slot = self.KEYS.get(key)
+        if slot is not None:
+            return getattr(self, slot, None)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self.KEYS.get(key)
+        if slot is None:
+            if value is None:
+                if self._extra is not None:
+                    self._extra.pop(key, None)
+                return
+            if self._extra is None:
+                self._extra = {}
+            self._extra[sys.intern(key)] = value
+        elif value is None:
+            with contextlib.suppress(AttributeError):
+                delattr(self, slot)
+        else:
+            setattr(self, slot, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __eq__(self, other):
+        if not hasattr(other, "items"):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, dict(self.items()))
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        if key in self.KEYS:
+            self[key] = None
+        elif self._extra is not None:
+            self._extra.pop(key, None)
+        return value
+
+    def setdefault(self, key, value):
+        if self.get(key) is None:
+            self[key] = value
+        return self.get(key)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        for key, slot in self.KEYS.items():
+            value = getattr(self, slot, None)
+            if value is not None:
+                yield key, value
+        if self._extra is not None:
+            yield from self._extra.items()
+
+    def to_dict(self):
+        return dict(self.items())
+
+def sparse_record_class(name, keys):
+    slots = dict((sys.intern(key), "_" + key.replace(".", "_")) for key in keys)
+    return type(name, (SparseRecord,), {"__slots__": list(slots.values()), "KEYS": slots})
+
+ProjectDesc = sparse_record_class("ProjectDesc", [
+    "backends", "exclude", "frontend", "inherits", "license.spdx", "license.file",
+    "project.name", "project.author", "project.copyright", "project.company",
+    "project.description", "project.directory", "version.major", "version.minor",
+    "version.patch", "version.pre_release", "version.dirty_suffix"
+    ])
+
+CookedInfo = sparse_record_class("CookedInfo", [
+    "version.major", "version.minor", "version.patch", "version.pre_release",
+    "version.string", "project.name", "project.author", "project.license",
+    "project.copyright", "project.company", "project.description",
+    "project.directory", "project.path", "license.spdx", "license.file",
+    "build.date", "build.time", "vcs.name", "vcs.commit_hash", "vcs.short_hash",
+    "vcs.tag", "vcs.branch", "vcs.commit_count", "vcs.path_commit_hash",
+    "vcs.path_commit_count", "vcs.dirty", "vcs.nearest_tag", "vcs.tag_distance"
+    ])
+
+def record_to_json(value):
+    # Default for json.dumps, records are written sparse.
+    if isinstance(value, SparseRecord):
+        return value.to_dict()
+    raise TypeError("'{}' is not JSON serializable".format(type(value).__name__))
+
+# ============================================================================ #
+# VerHel class
+# ============================================================================ #
+class VerHelFormatter(string.Formatter):
+    def convert_field(self, value, conversion):
+        if conversion == "u":
+            return str(value).upper()
+        elif conversion == "l":
+            return str(value).lower()
+        
+        return super().convert_field(value, conversion)
+
+class VerHelError(Exception):
+    def __init__(self, error_code):
+        self.error_code = error_code
+
+class VerHel:
+    def __init__(self):
+        self.projects             = {}
+        self.frontends            = {}
+        self.backends             = {}
+        self.projects_file        = None
+        self.resolved_projects    = {}
+        self.resolved_chains      = {}
+        self.loaded_shards        = {}
+        self.script_directory     = os.path.realpath(__file__)
+        self.command_timeout      = 2 # in seconds
+        self.vcs_deadline         = None # time.monotonic() based
+        self.vcs_deadline_hit     = False
+        self.abbrev_lengths       = {}
+        self.vcs_snapshot         = None
+        self.vcs_snapshot_key     = None
+        self.jobs                 = os.cpu_count() or 1
+        self.fsync                = False
+        self.check_stamp          = False
+        self.stamp_deps           = None
+        self.metrics              = Metrics()
+        self.wait_timeout         = None
+        self.cache_directory      = None
+        self.discover_cache       = None
+        self.fatal_if_bk_not_impl = False
+        self.emit_default_values  = False
+        self.DESC_TYPE            = dict # collections.OrderedDict
+        self.GLOBAL_DESC_NAME     = "_Global"
+        self.PROJECTS_DEFAULT_FILE_NAME  = "verhel.json"
+        self.PROJECTS_DEFAULT_DIRECTORY_NAME = "verhel.d"
+        self.STATE_DIRECTORY_NAME        = ".verhel"
+        self.IGNORE_FILE_NAME            = ".gitignore"
+        self.DISCOVER_PRUNED_NAMES       = [".git", ".hg", ".svn", ".verhel"]
+        self.HOOK_NAMES                  = ["post-checkout", "post-commit", "post-merge", "post-rewrite"]
+        self.COPROCESS_IDLE_TIMEOUT      = 60 # in seconds
+        self.FRONTENDS_DEFAULT_FILE_NAME = "frontends.json"
+        self.BACKENDS_DEFAULT_FILE_NAME  = "backends.json"
+        self.SERVED_COMMANDS             = ["generate", "get", "set", "info", "validate"]
+        self.PATH_ARGUMENTS              = ["projects_file", "frontends_file", "backends_file", "vcs_info_from", "metrics_file", "discover"]
+        self.VCS_FIELDS                  = ["commit_hash", "short_hash", "tag", "branch", "commit_count"]
+
+        # Frontend commands cooked vcs fields depend on.
+        self.VCS_FIELD_DEPENDS = {
+            "vcs.commit_hash":       ["get.commit_hash"],
+            "vcs.short_hash":        ["get.short_hash"],
+            "vcs.tag":               ["get.tag"],
+            "vcs.branch":            ["get.branch"],
+            "vcs.commit_count":      ["get.commit_count"],
+            "vcs.path_commit_hash":  ["get.commit_hash", "get.path_log", "get.is_ancestor"],
+            "vcs.path_commit_count": ["get.commit_hash", "get.path_log", "get.is_ancestor"],
+            "vcs.dirty":             ["get.dirty"],
+            "vcs.nearest_tag":       ["get.tag_peel", "get.first_parents"],
+            "vcs.tag_distance":      ["get.tag_peel", "get.first_parents"],
+            "vcs.submodules":        ["get.gitlinks"],
+        }
+
+        # Warm state, used by server mode.
+        self.keep_warm      = False
+        self.request_cwd    = None
+        self.projects_key   = None
+        self.warm_projects  = None
+        self.frontends_key  = None
+        self.backends_key   = None
+        self.renderer_cache = {}
+        self.vcs_memo       = {}
+        self.coprocesses    = {}
+        self.formatter      = VerHelFormatter()
+        self.state_directories = set()
+
+        self.log_bk_console = LogBackendConsole()
+        self.log_bk_file = LogBackendFile("verhel.log")
+        Log.add_backend(self.log_bk_console)
+        Log.add_backend(self.log_bk_file)
+
+    def load_from_buffer(self, buffer):
+        Log.info("loading json from buffer")
+
+        try:
+            root = json.loads(buffer, object_pairs_hook=self.DESC_TYPE)
+        except json.decoder.JSONDecodeError as e:
+            Log.error("failed to decode json: {}".format(e))
+            raise
+        else:
+            Log.success("loaded json from buffer succesfully")
+            return root
+
+    def load_from_file(self, file_name):
+        Log.info("loading file '{}'".format(file_name))
+
+        try:
+            with open(file_name, "r", encoding="utf-8") as f:
+                buffer = f.read()
+        except IOError as e:
+            Log.error("failed to read '{}'".format(file_name))
+            Log.error("{}".format(e))
+            raise
+        else:
+            Log.success("read file '{}'".format(file_name))
+            return self.load_from_buffer(buffer)
+
+    def catalog_from_root(self, root, validate_fn):
+        # Catalog of decoded description, entries are validated on access.
+        def load_entry(name):
+            validate_fn(name, root[name])
+            return root[name]
+
+        return Catalog(list(root.keys()), load_entry)
+
+    def catalog_from_directory(self, directory, validate_fn):
+        # Catalog of directory with json file per entry, named after it.
+        # Only listing is read, entries are decoded on access.
+        files = dict(self.shard_files(directory))
+
+        def load_entry(name):
+            try:
+                entry = self.load_from_file(files[name])
+            except (OSError, ValueError):
+                Log.fatal("failed to load '{}'".format(name))
+                raise VerHelError(ExitCodes.INVALID_CATALOG)
+            validate_fn(name, entry)
+            return entry
+
+        return Catalog(list(files.keys()), load_entry)
+
+    def load_frontends_from_buffer(self, buffer):
+        try:
+            root = self.load_from_buffer(buffer)
+        except:
+            return False
+        else:
+            self.frontends = self.catalog_from_root(root, self.validate_frontend)
+            return True
+
+    def load_frontends_from_object(self, root):
+        # Built-in catalog compiled by update command.
+        self.frontends = self.catalog_from_root(root, self.validate_frontend)
+        return True
+
+    def load_frontends_from_file(self, file_name):
+        try:
+            if os.path.isdir(file_name):
+                self.frontends = self.catalog_from_directory(file_name, self.validate_frontend)
+                return True
+            root = self.load_from_file(file_name)
+        except:
+            return False
+        else:
+            self.frontends = self.catalog_from_root(root, self.validate_frontend)
+            return True
+
+    def prepare_backend(self, backend_name, backend, directory):
+        # Validate backend, template path is relative to catalog directory.
+        self.validate_backend(backend_name, backend)
+        if backend.get("type") == "template" and backend.get("template") is not None:
+            backend["template"] = os.path.join(directory, backend["template"])
+
+    def load_backends_from_buffer(self, buffer):
+        try:
+            root = self.load_from_buffer(buffer)
+        except:
+            return False
+        else:
+            prepare = functools.partial(self.prepare_backend, directory=self.request_cwd or os.getcwd())
+            self.backends = self.catalog_from_root(root, prepare)
+            return True
+
+    def load_backends_from_object(self, root):
+        # Built-in catalog compiled by update command.
+        prepare = functools.partial(self.prepare_backend, directory=self.request_cwd or os.getcwd())
+        self.backends = self.catalog_from_root(root, prepare)
+        return True
+
+    def load_backends_from_file(self, file_name):
+        try:
+            if os.path.isdir(file_name):
+                prepare = functools.partial(self.prepare_backend, directory=os.path.abspath(file_name))
+                self.backends = self.catalog_from_directory(file_name, prepare)
+                return True
+            root = self.load_from_file(file_name)
+        except:
+            return False
+        else:
+            prepare = functools.partial(self.prepare_backend, directory=os.path.dirname(os.path.abspath(file_name)))
+            self.backends = self.catalog_from_root(root, prepare)
+            return True
+
+    def file_stat_key(self, file_name):
+        # Key used to detect file changes, None if file can't be stat.
+        try:
+            st = os.stat(file_name)
+        except OSError:
+            return None
+        else:
+            return (os.path.abspath(file_name), st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def catalog_key(self, file_name):
+        if file_name is None:
+            return "internal"
+        elif os.path.isdir(file_name):
+            try:
+                return tuple((name, self.file_stat_key(entry_file)) for name, entry_file in self.shard_files(file_name))
+            except OSError:
+                return None
+        else:
+            return self.file_stat_key(file_name)
+
+    def load_frontends(self, file_name=None):
+        key = self.catalog_key(file_name)
+        if self.keep_warm and key is not None and key == self.frontends_key:
+            Log.debug("using warm frontends ({})".format(len(self.frontends)))
+            return
+
+        if file_name is None:
+            if type(FRONTENDS_DESC) is str:
+                load_fn = self.load_frontends_from_buffer
+            else:
+                load_fn = self.load_frontends_from_object
+            load_arg = FRONTENDS_DESC
+            load_from = "internal description"
+        else:
+            load_fn = self.load_frontends_from_file
+            load_arg = file_name
+            load_from = file_name
+        
+        Log.info("loading frontends from '{}'".format(load_from))
+
+        if not load_fn(load_arg):
+            Log.fatal("failed to load frontends")
+            raise VerHelError(ExitCodes.FAILED_TO_LOAD_FRONTENDS)
+        else:
+            self.frontends_key = key
+            Log.success("loaded frontends ({})".format(len(self.frontends)))
+            Log.debug("loaded frontends: {}".format(list(self.frontends.keys())))
+
+    def load_backends(self, file_name=None):
+        key = self.catalog_key(file_name)
+        if self.keep_warm and key is not None and key == self.backends_key:
+            Log.debug("using warm backends ({})".format(len(self.backends)))
+            return
+
+        if file_name is None:
+            if type(BACKENDS_DESC) is str:
+                load_fn = self.load_backends_from_buffer
+            else:
+                load_fn = self.load_backends_from_object
+            load_arg = BACKENDS_DESC
+            load_from = "internal description"
+        else:
+            load_fn = self.load_backends_from_file
+            load_arg = file_name
+            load_from = file_name
+        
+        Log.info("loading backends from '{}'".format(load_from))
+
+        if not load_fn(load_arg):
+            Log.fatal("failed to load backends")
+            raise VerHelError(ExitCodes.FAILED_TO_LOAD_BACKENDS)
+        else:
+            self.backends_key = key
+            self.renderer_cache = {}
+            Log.success("loaded backends ({})".format(len(self.backends)))
+            Log.debug("loaded backends: {}".format(list(self.backends.keys())))
+
+    def default_projects_file(self):
+        # Sharded directory is used only if there is no projects file.
+        # Server resolves it against directory of the request.
+        file_name = self.resolve_path(self.PROJECTS_DEFAULT_FILE_NAME)
+        directory_name = self.resolve_path(self.PROJECTS_DEFAULT_DIRECTORY_NAME)
+        if not os.path.exists(file_name) and os.path.isdir(directory_name):
+            return directory_name
+        else:
+            return file_name
+
+    def resolve_path(self, path):
+        # Relative paths are relative to directory of the request in server
+        # mode, which doesn't change its working directory for requests.
+        if self.request_cwd is None or path is None:
+            return path
+        return os.path.join(self.request_cwd, path)
+
+    def is_sharded(self, file_name):
+        # Projects directory holds json file per project, named after it.
+        return os.path.isdir(file_name) or str(file_name).rstrip("/\\").endswith(".d")
+
+    def shard_file(self, directory, name):
+        # Json file of project or catalog entry in sharded directory.
+        return pathlib.Path(directory) / "{}.json".format(urllib.parse.quote(name, safe=""))
+
+    def shard_files(self, directory, names=None):
+        # (name, shard file) pairs, all shards if names is None.
+        if not os.path.isdir(directory):
+            raise FileNotFoundError("directory '{}' doesn't exist".format(directory))
+
+        if names is None:
+            return [(urllib.parse.unquote(entry.name[:-len(".json")]), pathlib.Path(entry.path))
+                for entry in sorted(os.scandir(directory), key=lambda entry: entry.name)
+                if entry.name.endswith(".json") and not entry.name.startswith(".") and entry.is_file()]
+        else:
+            return [(name, self.shard_file(directory, name))
+                for name in dict.fromkeys(names) if name is not None]
+
+    def projects_stat_key(self, file_name, names=None):
+        # Key used to detect changes of projects file, or of shards of given
+        # projects, None if it can't be stat.
+        if not self.is_sharded(file_name):
+            return self.file_stat_key(file_name)
+
+        try:
+            shard_files = self.shard_files(file_name, names)
+        except OSError:
+            return None
+        else:
+            return tuple((name, self.file_stat_key(shard_file)) for name, shard_file in shard_files)
+
+    def shards_unchanged(self, file_name):
+        # Shards loaded so far, including parents loaded through 'inherits',
+        # still have the stat they were loaded with.
+        return all(self.file_stat_key(self.shard_file(file_name, name)) == key
+            for name, key in self.loaded_shards.items())
+
+    def chain_stat_key(self, file_name, chain, current=False):
+        # Stats of shards of resolved inheritance chain, as they were loaded
+        # or current ones. None for single projects file, which is keyed
+        # as whole.
+        if not self.is_sharded(file_name):
+            return None
+        if current:
+            return json.dumps([[name, self.file_stat_key(self.shard_file(file_name, name))] for name in chain])
+        return json.dumps([[name, self.loaded_shards.get(name)] for name in chain])
+
+    def load_projects(self, file_name=None, names=None):
+        # Projects are in single file, or in directory of shards where only
+        # shards of given project names are read, all if names is None.
+        if file_name is None:
+            file_name = self.default_projects_file()
+        sharded = self.is_sharded(file_name)
+        
+        # Projects are modified by commands, so always work on a copy.
+        # Resolved descriptions are kept while the projects and parent
+        # shards they were resolved from don't change.
+        unchanged = self.projects_file == file_name and (not sharded or self.shards_unchanged(file_name))
+        self.projects_file = file_name
+        key = self.projects_stat_key(file_name, names)
+        if self.keep_warm and key is not None and key == self.projects_key and unchanged:
+            self.projects = copy.deepcopy(self.warm_projects)
+            Log.debug("using warm projects ({})".format(len(self.projects)))
+            return
+
+        self.resolved_projects = {}
+        self.resolved_chains = {}
+        self.loaded_shards = {}
+
+        Log.info("loading projects description from '{}'".format(file_name))
+
+        try:
+            if sharded:
+                root = self.DESC_TYPE()
+                for name, shard_file in self.shard_files(file_name, names):
+                    if names is None or shard_file.exists():
+                        self.loaded_shards[name] = self.file_stat_key(shard_file)
+                        root[name] = self.project_from_json(self.load_from_file(shard_file))
+            else:
+                root = self.load_from_file(file_name)
+                for name, desc in root.items():
+                    root[name] = self.project_from_json(desc)
+        except:
+            Log.fatal("failed to load projects")
+            raise VerHelError(ExitCodes.FAILED_TO_LOAD_PROJECTS)
+        else:
+            self.projects = root
+            if self.keep_warm:
+                self.projects_key = key
+                self.warm_projects = copy.deepcopy(root)
+            Log.success("loaded projects ({})".format(len(self.projects)))
+            Log.debug("loaded projects: {}".format(list(self.projects.keys())))
+
+    def iter_projects(self, file_name=None, match=None):
+        # Yields (name, description) of projects matching glob one at a
+        # time. Only matching shards are read from sharded directory,
+        # single file is decoded whole or, if it is large, read in chunks
+        # and decoded entry by entry.
+        if file_name is None:
+            file_name = self.default_projects_file()
+
+        Log.info("streaming projects description from '{}'".format(file_name))
+
+        if self.is_sharded(file_name):
+            for name, shard_file in self.shard_files(file_name):
+                if match is None or fnmatch.fnmatchcase(name, match):
+                    yield name, self.project_from_json(self.load_from_file(shard_file))
+        else:
+            with open(file_name, "r", encoding="utf-8") as f:
+                if os.fstat(f.fileno()).st_size < JSON_STREAM_THRESHOLD:
+                    root = json.load(f, object_pairs_hook=self.DESC_TYPE)
+                    if not isinstance(root, (dict, SparseRecord)):
+                        raise ValueError("expected object at 0")
+                    entries = root.items()
+                else:
+                    entries = iter_json_object(f, self.DESC_TYPE)
+                for name, desc in entries:
+                    if match is None or fnmatch.fnmatchcase(name, match):
+                        yield name, self.project_from_json(desc)
+
+    def project_from_json(self, desc):
+        # Invalid description is kept as is, so validation reports it.
+        if isinstance(desc, (dict, SparseRecord)):
+            return ProjectDesc(desc)
+        else:
+            return desc
+
+    def save_projects(self, file_name=None, names=None):
+        # Sharded projects are saved by writing shards of given project
+        # names, shards of projects that are no longer present are removed.
+        if file_name is None:
+            file_name = self.default_projects_file()
+        
+        Log.info("saving projects to '{}'".format(file_name))
+
+        if self.is_sharded(file_name):
+            if names is None:
+                names = list(self.projects.keys())
+            try:
+                pathlib.Path(file_name).mkdir(parents=True, exist_ok=True)
+                for name, shard_file in self.shard_files(file_name, names):
+                    if name in self.projects:
+                        write_file_atomic(shard_file, json.dumps(self.projects[name], indent=4, default=record_to_json))
+                        Log.success("wrote project file '{}'".format(shard_file))
+                    else:
+                        with contextlib.suppress(FileNotFoundError):
+                            os.unlink(shard_file)
+                            Log.success("removed project file '{}'".format(shard_file))
+            except OSError as e:
+                Log.error("failed to write '{}'".format(file_name))
+                Log.error("{}".format(e))
+                raise VerHelError(ExitCodes.FAILED_TO_SAVE_PROJECTS)
+            return
+
+        try:
+            write_file_atomic(file_name, json.dumps(self.projects, indent=4, default=record_to_json))
+        except IOError as e:
+            Log.error("failed to write '{}'".format(file_name))
+            Log.error("{}".format(e))
+            raise VerHelError(ExitCodes.FAILED_TO_SAVE_PROJECTS)
+        else:
+            Log.success("wrote project file '{}'".format(file_name))
+        
+    def empty_project(self):
+        return {
+            "backends": [],
+            "exclude": [],
+            "frontend": None,
+            "license.spdx": None,
+            "license.file": None,
+            "project.name": None,
+            "project.author": None,
+            "project.copyright": None,
+            "project.description": None,
+            "project.directory": None,
+            "version.major": None,
+            "version.minor": None,
+            "version.patch": None,
+            "version.pre_release": None,
+            "version.dirty_suffix": None,
+            "inherits": None
+        }
+
+    def default_project(self):
+        return {
+            "backends": [],
+            "exclude": [],
+            "frontend": "",
+            "license.spdx": "",
+            "license.file": "",
+            "project.name": "",
+            "project.author": "",
+            "project.copyright": "",
+            "project.description": "",
+            "project.directory": "",
+            "version.major": 0,
+            "version.minor": 1,
+            "version.patch": 0,
+            "version.pre_release": "",
+            "version.dirty_suffix": "",
+            "inherits": ""
+        }        
+
+    def validate_project(self, project_name):
+        def check(desc, key, expected_type):
+            # Null is allowed.
+            ty = type(desc.get(key))
+            if ty is not expected_type and ty is not type(None):
+                raise TypeError(
+                    "invalid type for key '{}' expected '{}' found '{}'".format(
+                        key,
+                        expected_type.__name__,
+                        ty.__name__
+                    )
+                )
+        
+        Log.info("validating project '{}'".format(project_name))
+        desc = self.projects.get(project_name)
+        try:
+            if type(desc) is not ProjectDesc:
+                raise TypeError("project description is not an object")
+
+            # Check version.
+            check(desc, "version.major", int)
+            check(desc, "version.minor", int)
+            check(desc, "version.patch", int)
+            check(desc, "version.pre_release", str)
+            check(desc, "version.dirty_suffix", str)
+
+            # Check backends.
+            backends_list = desc.get("backends")
+            if backends_list is not None:
+                check(desc, "backends", list)
+                for bk in backends_list:
+                    index = backends_list.index(bk)
+                    if not isinstance(bk, (dict, SparseRecord)):
+                        raise TypeError("backend[{}] is not an object".format(index))
+                    if len(bk.items()) > 1:
+                        raise Exception("backend[{}] only one item in object is allowed".format(index))
+
+                    for name, output in bk.items():
+                        check(bk, name, str)
+
+                        # Backend output can't be null.
+                        if output is None:
+                            raise TypeError("backend '{}' output is null".format(name))
+
+                # Check for duplicates.
+                for bk in backends_list:
+                    index = backends_list.index(bk)
+                    name = list(bk.keys())[0]
+                    output = bk.get(name)
+                    for i in range(len(backends_list)):
+                        if i == index:
+                            continue
+
+                        # Duplicated name.
+                        if backends_list[i].get(name) is not None:
+                            raise Exception("duplicated backend '{}'".format(name))
+
+                        # Duplicated output.
+                        other_name = list(backends_list[i].keys())[0]
+                        other_output = backends_list[i].get(other_name)
+                        
+                        if other_output == output:
+                            raise Exception("backends output '{}' and '{}' override eachother"
+                                .format(name, other_name)
+                                )
+
+            # Check forntend.
+            check(desc, "frontend", str)
+
+            # Check parent.
+            check(desc, "inherits", str)
+
+            # Check rest.
+            check(desc, "license.spdx", str)
+            check(desc, "license.file", str)
+            check(desc, "project.author", str)
+            check(desc, "project.copyright", str)
+            check(desc, "project.company", str)
+            check(desc, "project.description", str)
+            check(desc, "project.directory", str)
+            check(desc, "project.name", str)
+
+            check(desc, "exclude", list)
+        except TypeError as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to validate project '{}'".format(project_name))
+            raise VerHelError(ExitCodes.PROJECT_VALIDATION_FAILED)
+        except Exception as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to validate project '{}'".format(project_name))
+            raise VerHelError(ExitCodes.PROJECT_VALIDATION_FAILED)
+        else:
+            # Check for dangling properties.
+            empty = self.empty_project()
+            for key, _ in desc.items():
+                if not key in empty:
+                    Log.warn("dangling property '{}'".format(key))
+
+            Log.success("project '{}' validated".format(project_name))
+
+    def validate_version(self, desc):
+        if desc.get("version.major") is None:
+            Log.fatal("version.major is null")
+            raise VerHelError(ExitCodes.VERSION_IS_NULL)
+        if desc.get("version.minor") is None:
+            Log.fatal("version.minor is null")
+            raise VerHelError(ExitCodes.VERSION_IS_NULL)
+        if desc.get("version.patch") is None:
+            Log.fatal("version.patch is null")
+            raise VerHelError(ExitCodes.VERSION_IS_NULL)
+
+    def validate_frontend(self, frontend_name, frontend):
+        def check(desc, key, expected_type):
+            # Objects may be plain dicts or records.
+            if not isinstance(desc.get(key), expected_type):
+                raise TypeError(
+                    "invalid type for key '{}' expected '{}' found '{}'".format(
+                        key,
+                        getattr(expected_type, "__name__", "object"),
+                        type(desc.get(key)).__name__
+                    )
+                )
+
+        Log.info("validating frontend '{}'".format(frontend_name))
+        try:
+            if not isinstance(frontend, (dict, SparseRecord)):
+                raise TypeError("frontend description is not an object")
+
+            if frontend.get("type") == "env":
+                check(frontend, "vars", (dict, SparseRecord))
+                for field, var_names in frontend["vars"].items():
+                    check(frontend["vars"], field, list)
+            else:
+                # Executable is optional, it's only checked to be installed.
+                if "exe" in frontend:
+                    check(frontend, "exe", str)
+                for key, cmd in frontend.items():
+                    if key.startswith("get."):
+                        check(frontend, key, (dict, SparseRecord))
+                        check(cmd, "cmd", str)
+                        check(cmd, "ret_codes", list)
+        except TypeError as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to validate frontend '{}'".format(frontend_name))
+            raise VerHelError(ExitCodes.INVALID_CATALOG)
+
+    def validate_backend(self, backend_name, backend):
+        def check(desc, key, expected_type):
+            if type(desc.get(key)) is not expected_type:
+                raise TypeError(
+                    "invalid type for key '{}' expected '{}' found '{}'".format(
+                        key,
+                        expected_type.__name__,
+                        type(desc.get(key)).__name__
+                    )
+                )
+
+        Log.info("validating backend '{}'".format(backend_name))
+        try:
+            if not isinstance(backend, (dict, SparseRecord)):
+                raise TypeError("backend description is not an object")
+
+            # Template is file or inline text.
+            if backend.get("type") == "template":
+                if backend.get("template") is None:
+                    check(backend, "template.text", str)
+                else:
+                    check(backend, "template", str)
+                return
+
+            for key in ["source.begin", "source.comment", "source.end", "format.number", "format.string"]:
+                check(backend, key, str)
+
+            # Backends written before bool values existed don't have it.
+            if backend.get("format.bool") is not None:
+                check(backend, "format.bool", str)
+
+            check(backend, "var_map", list)
+            for index, var in enumerate(backend["var_map"]):
+                if not isinstance(var, (dict, SparseRecord)) or len(var) != 1:
+                    raise TypeError("var_map[{}] must be object with one item".format(index))
+                for var_name, emit_name in var.items():
+                    check(var, var_name, str)
+        except TypeError as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to validate backend '{}'".format(backend_name))
+            raise VerHelError(ExitCodes.INVALID_CATALOG)
+
+    def resolve_project(self, project_name, glob_desc_name=None):
+        # Description with null values taken from parent named by 'inherits'
+        # or from global description at the end of the chain. Resolved
+        # descriptions are memoized until projects are loaded again, so
+        # shared parents are resolved once. Resolved descriptions must
+        # not be modified.
+        chain = []
+        name = project_name
+        while name is not None:
+            resolved = self.resolved_projects.get((name, glob_desc_name))
+            if resolved is not None:
+                break
+
+            if name in chain:
+                Log.fatal("inheritance cycle '{}'".format(" -> ".join(chain + [name])))
+                raise VerHelError(ExitCodes.PROJECT_VALIDATION_FAILED)
+            chain.append(name)
+
+            self.load_missing_projects([name])
+            if self.projects.get(name) is None:
+                Log.fatal("project '{}' inherits from '{}' which doesn't exist".format(chain[-2], name))
+                raise VerHelError(ExitCodes.PROJECT_DOESNT_EXISTS)
+            self.validate_project(name)
+
+            parent_name = self.projects[name].get("inherits")
+            if parent_name is None and glob_desc_name is not None and name != glob_desc_name:
+                parent_name = glob_desc_name
+            name = parent_name
+
+        # Merge from the top, child values override parent values. Names
+        # of the whole chain are kept, so its shards can be checked.
+        tail = [] if resolved is None else self.resolved_chains[(name, glob_desc_name)]
+        for name in reversed(chain):
+            desc = self.projects[name]
+            if resolved is not None:
+                merged = ProjectDesc(resolved)
+                for key, value in desc.items():
+                    merged[key] = value
+                resolved = merged
+            else:
+                resolved = desc
+            tail = [name] + tail
+            self.resolved_projects[(name, glob_desc_name)] = resolved
+            self.resolved_chains[(name, glob_desc_name)] = tail
+
+        if len(chain) > 1:
+            Log.info("resolved project '{}' from '{}'".format(project_name, " -> ".join(chain)))
+
+        return resolved
+
+    def load_missing_projects(self, names):
+        # Sharded projects that weren't loaded, e.g. parents, are loaded
+        # when needed.
+        file_name = self.projects_file
+        if file_name is None or not self.is_sharded(file_name):
+            return
+
+        missing = [name for name in names if name not in self.projects]
+        try:
+            for name, shard_file in self.shard_files(file_name, missing):
+                if shard_file.exists():
+                    self.loaded_shards[name] = self.file_stat_key(shard_file)
+                    self.projects[name] = self.project_from_json(self.load_from_file(shard_file))
+        except:
+            Log.fatal("failed to load projects")
+            raise VerHelError(ExitCodes.FAILED_TO_LOAD_PROJECTS)
+
+    def check_if_project_exists(self, project_name):
+        Log.info("checking if project '{}' exists".format(project_name))
+
+        desc = self.projects.get(project_name)
+        if desc is None:
+            Log.fatal("project '{}' doesn't exists".format(project_name))
+            raise VerHelError(ExitCodes.PROJECT_DOESNT_EXISTS)
+
+        Log.info("project description '{}' found".format(project_name))
+        return desc
+    
+    def check_if_frontend_exists(self, frontend_name):
+        Log.info("checking if frontend '{}' is implemented".format(frontend_name))
+        
+        frontend = self.frontends.get(frontend_name)
+        if frontend is None:
+            Log.fatal("frontend '{}' doesn't exists".format(frontend_name))
+            raise VerHelError(ExitCodes.FRONTEND_DOESNT_EXISTS)
+
+        Log.success("fronted '{}' found".format(frontend_name))
+        return frontend
+
+    def check_if_backends_exists(self, backends_list):
+        bklstr = [name for bk in backends_list for name, _ in bk.items()]
+        Log.info("checking if backends '{}' are implemented".format(bklstr))
+        
+        found = 0
+        for bk in backends_list:
+            for name, _ in bk.items():
+                if self.backends.get(name) is None:
+                    err_msg = "backend '{}' not found".format(name)
+                    if self.fatal_if_bk_not_impl:
+                        Log.fatal(err_msg)
+                        raise VerHelError(ExitCodes.BACKEND_DOESNT_EXISTS)
+                    else:
+                        Log.error(err_msg)
+
+                    found = found + 1
+                else:
+                    Log.success("backend '{}' found".format(name))
+
+        if found == len(backends_list):
+            Log.success("all backends used by project are implemented")
+        else:
+            Log.warn("not all backends used by project are implemented")
+
+    def cd_into_project_directory(self, desc):
+        Log.info("building project path")
+        project_directory = desc.get("project.directory")
+
+        # If project.directory is null, then current working directory
+        # is consitered project root.
+        full_path = pathlib.Path(self.request_cwd or os.getcwd())
+        if project_directory is not None:
+            # If path is absolute than use it as directory.
+            # Otherwise concat with current working directory.
+            if pathlib.Path(project_directory).is_absolute():
+                full_path = pathlib.Path(project_directory)
+            else:
+                full_path = full_path / pathlib.Path(project_directory)
+        
+        # If projet directory don't exists, create.
+        if not full_path.exists():
+            Log.info("project directory don't exist, creating")
+            pathlib.Path(full_path).mkdir(parents=True, exist_ok=True) 
+
+        Log.info("changing directory to '{}'".format(full_path))
+        try:
+            os.chdir(full_path)
+        except OSError as e:
+            Log.fatal("failed to change directory")
+            Log.error("{}".format(e))
+            raise VerHelError(ExitCodes.FAILED_TO_ENTER_PROJECT_DIR)
+        else:
+            Log.success("successfuly cd into project directory")
+
+    def cmd_timeout(self, cmd, timeout=None):
+        if timeout is None:
+            timeout = self.command_timeout
+
+        # Overall deadline limits the timeout of each command.
+        if self.vcs_deadline is not None:
+            remaining = self.vcs_deadline - time.monotonic()
+            if remaining <= 0:
+                self.vcs_deadline_hit = True
+                raise Exception("Deadline exceeded, command '{}' not executed".format(cmd))
+            timeout = min(timeout, remaining)
+
+        return timeout
+
+    def run_cmd(self, cmd, timeout=None, cwd=None, cmd_name=None):
+        args = shlex.split(cmd)
+        Log.debug("args: {}".format(args))
+
+        timeout = self.cmd_timeout(cmd, timeout)
+
+        self.metrics.inc("verhel_run_cmd_spawns_total")
+        start = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                args,
+                capture_output=True,
+                timeout=timeout,
+                encoding="utf-8",
+                cwd=cwd
+                )
+        except subprocess.TimeoutExpired:
+            Log.error("command failed")
+            if self.vcs_deadline is not None and time.monotonic() >= self.vcs_deadline:
+                self.vcs_deadline_hit = True
+            raise Exception("Command '{}' timed out".format(cmd))
+        except:
+            Log.error("command failed")
+            raise Exception("Unknown error when executing '{}'".format(cmd))
+        finally:
+            if cmd_name is not None:
+                self.metrics.observe("verhel_vcs_command_duration_seconds", time.perf_counter() - start, cmd_name=cmd_name)
+
+        Log.debug("    return code: {}".format(proc.returncode))
+        Log.debug("    output: {}".format(proc.stdout.strip()))
+
+        return (proc.returncode, proc.stdout)
+
+    @contextlib.contextmanager
+    def stream_cmd(self, cmd, timeout=None, cwd=None, cmd_name=None):
+        # Same as run_cmd, but output lines are read while command runs,
+        # so reader can stop early. Command is killed when timeout expires,
+        # even if it doesn't write anything.
+        args = shlex.split(cmd)
+        Log.debug("args: {}".format(args))
+
+        timeout = self.cmd_timeout(cmd, timeout)
+
+        self.metrics.inc("verhel_run_cmd_spawns_total")
+        start = time.perf_counter()
+        try:
+            proc = subprocess.Popen(
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                encoding="utf-8",
+                cwd=cwd
+                )
+        except:
+            Log.error("command failed")
+            raise Exception("Unknown error when executing '{}'".format(cmd))
+
+        expired = threading.Event()
+        def expire():
+            expired.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+        try:
+            with proc:
+                try:
+                    yield proc.stdout
+                finally:
+                    proc.kill()
+        finally:
+            timer.cancel()
+            if cmd_name is not None:
+                self.metrics.observe("verhel_vcs_command_duration_seconds", time.perf_counter() - start, cmd_name=cmd_name)
+
+        if expired.is_set():
+            Log.error("command failed")
+            if self.vcs_deadline is not None and time.monotonic() >= self.vcs_deadline:
+                self.vcs_deadline_hit = True
+            raise Exception("Command '{}' timed out".format(cmd))
+
+    def check_if_vcs_is_installed(self, frontend):
+        exe_name = frontend.get("exe")
+        if exe_name is None:
+            Log.info("frontend doesn't use vcs executable")
+            return
+
+        Log.info("checking if vcs executable '{}' is found".format(exe_name))
+        
+        if not shutil.which(exe_name):
+            Log.fatal("vcs is not installed or not in path")
+            raise VerHelError(ExitCodes.VERSION_CONTROL_NOT_INSTALLED)
+        else:
+            Log.success("vcs executable '{}' found".format(exe_name))
+
+    def check_if_project_repo_exists(self, frontend):
+        Log.info("checking if repo exists")
+
+        get_repo = frontend.get("get.repo")
+        try:
+            ret, _ = self.run_cmd(get_repo.get("cmd"), cmd_name="get.repo")
+        except Exception as e:
+            # Continue in degraded mode, missing values are filled later.
+            if self.vcs_deadline_hit:
+                Log.warn(e)
+                return
+            Log.error(e)
+            raise VerHelError(ExitCodes.REPO_DOESNT_EXISTS)
+        else: 
+            if ret not in get_repo.get("ret_codes"):
+                Log.fatal("version control repository doesn't exists")
+                raise VerHelError(ExitCodes.REPO_DOESNT_EXISTS)
+            else:
+                Log.success("version control repository found")
+
+    def run_frontend_cmd(self, frontend, cmd_name, params={}, cwd=None):
+        # Run command with parameters, returns output or None on failure.
+        cmd_obj = frontend.get(cmd_name)
+        if cmd_obj is None or cmd_obj.get("cmd") is None:
+            Log.error("command '{}' is not defined in frontend".format(cmd_name))
+            return None
+
+        cmd = cmd_obj.get("cmd").format(**params)
+        try:
+            Log.info("command '{}' ('{}')".format(cmd_name, cmd))
+            ret, out = self.run_cmd(cmd, cmd_obj.get("timeout"), cwd, cmd_name)
+        except Exception as e:
+            Log.error(e)
+            return None
+
+        if ret not in cmd_obj.get("ret_codes"):
+            Log.error("command failed")
+            return None
+
+        Log.success("command finished")
+        return (ret, out)
+
+    def read_cache(self, name):
+        if self.cache_directory is None:
+            return None
+
+        try:
+            with open(self.cache_directory / name, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def write_cache(self, name, data):
+        if self.cache_directory is None:
+            return
+
+        try:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(self.cache_directory / name, json.dumps(data))
+        except OSError as e:
+            Log.warn("failed to write cache '{}': {}".format(name, e))
+
+    def build_path_index(self, log_output):
+        # Map every directory touched by commits to the newest commit
+        # that touched it and number of commits that touched it.
+        # Log is ordered from newest to oldest.
+        paths = {}
+        commit = None
+        dirs = set()
+
+        def flush():
+            for directory in dirs:
+                entry = paths.get(directory)
+                if entry is None:
+                    paths[directory] = [commit, 1]
+                else:
+                    entry[1] += 1
+
+        for line in log_output.splitlines():
+            if line.startswith("commit:"):
+                if commit is not None:
+                    flush()
+                commit = line[len("commit:"):]
+                dirs = set()
+            elif line and commit is not None:
+                parts = line.split("/")[:-1]
+                dirs.add("")
+                for i in range(len(parts)):
+                    dirs.add("/".join(parts[:i + 1]))
+
+        if commit is not None:
+            flush()
+
+        return paths
+
+    def get_vcs_path_info(self, frontend, head):
+        # Per directory info backed by path index cached per repository.
+        # When HEAD moves forward only new commits are read.
+        info = {"path_commit_hash": None, "path_commit_count": None}
+
+        work_tree = self.find_work_tree(pathlib.Path.cwd())
+        git_dir = self.find_git_dir(pathlib.Path.cwd())
+        if head is None or work_tree is None or git_dir is None:
+            Log.warn("can't build path index, repository or HEAD not found")
+            return info
+
+        prefix = pathlib.Path.cwd().resolve().relative_to(work_tree).as_posix()
+        if prefix == ".":
+            prefix = ""
+
+        cache_name = "path-index-{}.json".format(hashlib.sha1(str(git_dir).encode("utf-8")).hexdigest()[:16])
+        index = self.read_cache(cache_name)
+
+        self.metrics.cache("path_index", index is not None and index.get("head") == head)
+        if index is not None and index.get("head") == head:
+            Log.info("using cached path index")
+            paths = index.get("paths")
+        else:
+            paths = None
+            if index is not None:
+                ancestor = self.run_frontend_cmd(frontend, "get.is_ancestor", {"old": index.get("head"), "new": head})
+                if ancestor is not None and ancestor[0] == 0:
+                    result = self.run_frontend_cmd(frontend, "get.path_log", {"range": "{}..{}".format(index.get("head"), head)})
+                    if result is not None:
+                        Log.info("extending path index")
+                        paths = index.get("paths")
+                        for directory, (commit, count) in self.build_path_index(result[1]).items():
+                            entry = paths.get(directory)
+                            paths[directory] = [commit, count if entry is None else entry[1] + count]
+
+            if paths is None:
+                Log.info("building path index")
+                result = self.run_frontend_cmd(frontend, "get.path_log", {"range": head})
+                if result is None:
+                    return info
+                paths = self.build_path_index(result[1])
+
+            self.write_cache(cache_name, {"head": head, "paths": paths})
+
+        entry = paths.get(prefix)
+        if entry is not None:
+            info["path_commit_hash"] = entry[0]
+            info["path_commit_count"] = entry[1]
+        else:
+            info["path_commit_count"] = 0
+
+        return info
+
+    def read_gitmodules(self, work_tree):
+        # Returns list of (name, path) from '.gitmodules'.
+        submodules = []
+        try:
+            with open(work_tree / ".gitmodules", "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except IOError:
+            return submodules
+
+        name = None
+        for line in lines:
+            section = re.match(r'^\s*\[submodule\s+"(.*)"\]\s*$', line)
+            if section is not None:
+                name = section.group(1)
+                continue
+
+            path = re.match(r'^\s*path\s*=\s*(.*?)\s*$', line)
+            if path is not None and name is not None:
+                submodules.append((name, path.group(1)))
+
+        return submodules
+
+    def get_vcs_submodules_info(self, frontend):
+        # Submodules are listed in '.gitmodules', commit recorded
+        # by superproject is taken from gitlinks (mode 160000) in index.
+        # Info of checked out submodules is collected concurrently.
+        work_tree = self.find_work_tree(pathlib.Path.cwd())
+        if work_tree is None:
+            return {}
+
+        submodules = self.read_gitmodules(work_tree)
+        if len(submodules) == 0:
+            return {}
+
+        Log.info("getting info for {} submodules".format(len(submodules)))
+
+        paths = " ".join(shlex.quote(path) for _, path in submodules)
+        result = self.run_frontend_cmd(frontend, "get.gitlinks", {"paths": paths}, work_tree)
+        gitlinks = {}
+        if result is not None:
+            for line in result[1].splitlines():
+                meta, _, path = line.partition("\t")
+                meta = meta.split()
+                if len(meta) == 3 and meta[0] == "160000":
+                    gitlinks[path] = meta[1]
+
+        info = {}
+        tasks = []
+        for name, path in submodules:
+            sub_dir = work_tree / path
+            info[name] = {"commit_hash": gitlinks.get(path), "short_hash": None, "tag": None}
+            if (sub_dir / ".git").exists():
+                for field in ["commit_hash", "short_hash", "tag"]:
+                    tasks.append((name, field, sub_dir))
+            else:
+                Log.warn("submodule '{}' is not checked out, using commit from gitlink".format(name))
+
+        def run_task(task):
+            name, field, sub_dir = task
+            return self.run_frontend_cmd(frontend, "get." + field, {}, sub_dir)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for (name, field, _), result in zip(tasks, pool.map(run_task, tasks)):
+                if result is not None:
+                    info[name][field] = result[1].strip()
+
+        Log.info("finished getting submodules info")
+        return info
+
+    def tags_state_key(self, common_dir):
+        # Tags change when packed-refs is rewritten or loose tag is
+        # added/removed/updated, which changes mtime of its directory.
+        # Nested tag directories (e.g. refs/tags/rel/) are walked too.
+        key = [self.file_stat_key(common_dir / "packed-refs")]
+        for directory, _, _ in os.walk(common_dir / "refs" / "tags"):
+            key.append(self.file_stat_key(directory))
+
+        return key
+
+    def build_tag_index(self, frontend, common_dir):
+        # Map commit to tag names. Annotated tags are peeled by the same
+        # command that lists them, tag that can't be read is skipped.
+        # Raises if index can't be built whole, partial index is never
+        # returned, so it isn't cached.
+        index = {}
+
+        result = self.run_frontend_cmd(frontend, "get.tag_peel", {}, common_dir)
+        if result is None and self.vcs_deadline_hit:
+            raise Exception("deadline exceeded, tag index not built")
+        if result is None:
+            # Whole listing fails on single broken tag, peel them one by
+            # one through coprocess then.
+            Log.warn("failed to list tags, peeling tags one by one")
+            return self.build_tag_index_by_one(frontend, common_dir)
+
+        for line in result[1].splitlines():
+            parts = line.split(" ")
+            if len(parts) != 3 or not parts[2].startswith("refs/tags/"):
+                continue
+
+            commit = parts[1] if len(parts[1]) > 0 else parts[0]
+            index.setdefault(commit, []).append(parts[2][len("refs/tags/"):])
+
+        return index
+
+    def build_tag_index_by_one(self, frontend, common_dir):
+        # Tag names are read from packed-refs and loose refs, each is peeled
+        # by coprocess query, tags that can't be peeled are skipped.
+        index = {}
+        if frontend.get("coproc") is None:
+            raise Exception("tags can't be peeled one by one without coprocess")
+
+        names = set()
+        try:
+            with open(common_dir / "packed-refs", "r", encoding="utf-8") as f:
+                for line in f:
+                    _, _, ref = line.strip().partition(" ")
+                    if ref.startswith("refs/tags/"):
+                        names.add(ref[len("refs/tags/"):])
+        except IOError:
+            pass
+
+        tags_dir = common_dir / "refs" / "tags"
+        names.update(path.relative_to(tags_dir).as_posix() for path in tags_dir.rglob("*") if path.is_file())
+
+        coprocess = self.get_coprocess(frontend)
+        for name in sorted(names):
+            answer = self.query_coprocess(coprocess, "refs/tags/{}^{{commit}}".format(name), self.cmd_timeout("peel tag"), "get.tag_peel")
+            answer = answer.split()
+            if len(answer) == 3:
+                index.setdefault(answer[0], []).append(name)
+            else:
+                Log.warn("skipping tag '{}', it can't be peeled".format(name))
+
+        return index
+
+    def get_vcs_nearest_tag(self, frontend):
+        # Walk first parent history from HEAD until commit with tag is found,
+        # distance is number of commits from the tag. Same as 'git describe
+        # --tags --first-parent', commits brought in by merges are not
+        # counted, so it can differ from plain 'git describe' on merges.
+        info = {"nearest_tag": None, "tag_distance": None}
+
+        git_dir = self.find_git_dir(pathlib.Path.cwd())
+        if git_dir is None:
+            return info
+        common_dir = self.find_common_dir(git_dir)
+
+        cache_name = "tag-index-{}.json".format(hashlib.sha1(str(common_dir).encode("utf-8")).hexdigest()[:16])
+        key = json.dumps(self.tags_state_key(common_dir))
+        cache = self.read_cache(cache_name)
+        self.metrics.cache("tag_index", cache is not None and cache.get("key") == key)
+        if cache is not None and cache.get("key") == key:
+            Log.info("using cached tag index")
+            index = cache.get("tags")
+        else:
+            Log.info("building tag index")
+            try:
+                index = self.build_tag_index(frontend, common_dir)
+            except Exception as e:
+                Log.error(e)
+                return info
+
+            # Index built after deadline expired may miss tags.
+            if not self.vcs_deadline_hit:
+                self.write_cache(cache_name, {"key": key, "tags": index})
+
+        if len(index) == 0:
+            return info
+
+        def version_key(name):
+            return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", name)]
+
+        cmd_obj = frontend.get("get.first_parents")
+        Log.info("command 'get.first_parents' ('{}')".format(cmd_obj.get("cmd")))
+        try:
+            with self.stream_cmd(cmd_obj.get("cmd"), cmd_obj.get("timeout"), cmd_name="get.first_parents") as lines:
+                for distance, line in enumerate(lines):
+                    names = index.get(line.strip())
+                    if names is not None:
+                        info["nearest_tag"] = max(names, key=version_key)
+                        info["tag_distance"] = distance
+                        break
+        except Exception as e:
+            Log.error(e)
+
+        Log.success("nearest tag '{}' distance {}".format(info["nearest_tag"], info["tag_distance"]))
+        return info
+
+    def get_vcs_dirty(self, frontend):
+        # Dirty when tracked files differs from HEAD, untracked files are
+        # not checked. 'git diff' refreshes stat info of the index like
+        # 'git status' does (using fsmonitor when enabled), so files that
+        # were only touched are clean. It writes the refreshed index only
+        # if it can take the lock, so it doesn't race concurrent git
+        # commands. Result isn't cached, edits of working tree don't change
+        # anything cheaper to check than what git checks. Optional
+        # 'refresh' command runs before.
+        start = time.perf_counter()
+        cmd_obj = frontend.get("get.dirty")
+        if cmd_obj.get("refresh") is not None:
+            try:
+                self.run_cmd(cmd_obj.get("refresh"), cmd_obj.get("timeout"), cmd_name="get.dirty.refresh")
+            except Exception as e:
+                Log.warn(e)
+
+        result = self.run_frontend_cmd(frontend, "get.dirty")
+        if result is None:
+            return None
+        dirty = result[0] != 0
+
+        Log.info("dirty state '{}' in {:.1f} ms".format(dirty, (time.perf_counter() - start) * 1000))
+        return dirty
+
+    def get_coprocess(self, frontend):
+        # One coprocess per repository (worktree), kept for whole run.
+        git_dir = self.find_git_dir(pathlib.Path.cwd())
+        if git_dir is None:
+            return None
+
+        key = (frontend.get("coproc").get("cmd"), str(git_dir))
+        coprocess = self.coprocesses.get(key)
+        if coprocess is None:
+            # Spawns are counted in metrics of the run that caused them.
+            coprocess = Coprocess(key[0], str(pathlib.Path.cwd()), frontend.get("coproc").get("restarts", 0),
+                lambda: self.metrics.inc("verhel_run_cmd_spawns_total"))
+            self.coprocesses[key] = coprocess
+
+        return coprocess
+
+    def query_coprocess(self, coprocess, line, timeout, cmd_name=None):
+        # Queries are timed like commands they replace.
+        start = time.perf_counter()
+        try:
+            return coprocess.query(line, timeout)
+        finally:
+            if cmd_name is not None:
+                self.metrics.observe("verhel_vcs_command_duration_seconds", time.perf_counter() - start, cmd_name=cmd_name)
+
+    def close_coprocesses(self, idle=None):
+        # Close coprocesses not used for idle seconds, all if None.
+        for key, coprocess in list(self.coprocesses.items()):
+            if idle is None or time.monotonic() - coprocess.last_used >= idle:
+                Log.info("closing coprocess '{}'".format(coprocess.cmd))
+                coprocess.close()
+                self.coprocesses.pop(key)
+
+    def run_batch_query(self, coprocess, cmd_obj, cmd_name=None):
+        timeout = self.command_timeout
+        if self.vcs_deadline is not None:
+            timeout = min(timeout, self.vcs_deadline - time.monotonic())
+            if timeout <= 0:
+                self.vcs_deadline_hit = True
+                raise Exception("Deadline exceeded, query '{}' not executed".format(cmd_obj.get("batch")))
+
+        Log.info("batch query '{}'".format(cmd_obj.get("batch")))
+        answer = self.query_coprocess(coprocess, cmd_obj.get("batch"), timeout, cmd_name).split()
+        if len(answer) != 3:
+            Log.error("query failed: '{}'".format(" ".join(answer)))
+            return None
+        object_name = answer[0]
+
+        # Shortest unique prefix, starting with length git uses. It's asked
+        # from git by running the command once per repository in a run,
+        # its output is the answer then.
+        if cmd_obj.get("batch_abbrev"):
+            git_dir = str(self.find_git_dir(pathlib.Path.cwd()))
+            length = self.abbrev_lengths.get(git_dir)
+            if length is None:
+                ret, out = self.run_cmd(cmd_obj.get("cmd"), cmd_obj.get("timeout"), cmd_name=cmd_name)
+                out = out.strip()
+                if ret in cmd_obj.get("ret_codes") and out and object_name.startswith(out.lower()):
+                    self.abbrev_lengths[git_dir] = len(out)
+                    Log.success("query finished")
+                    return out
+                Log.warn("can't get abbreviation length from git, using {}".format(DEFAULT_ABBREV_LENGTH))
+                length = self.abbrev_lengths[git_dir] = DEFAULT_ABBREV_LENGTH
+
+            while length < len(object_name):
+                answer = self.query_coprocess(coprocess, object_name[:length], timeout, cmd_name).split()
+                if len(answer) == 3 and answer[0] == object_name:
+                    break
+                length += 1
+            object_name = object_name[:length]
+
+        Log.success("query finished")
+        return object_name
+
+    def get_vcs_info(self, frontend, frontend_name, fields=None):
+        def run_wrapper(cmd_name, out_type = str):
+            cmd_obj = frontend.get(cmd_name)
+
+            # Answer from coprocess if possible, fallback to command.
+            if coprocess is not None and cmd_obj.get("batch") is not None:
+                try:
+                    value = self.run_batch_query(coprocess, cmd_obj, cmd_name)
+                except Exception as e:
+                    Log.warn(e)
+                else:
+                    return None if value is None else out_type(value)
+
+            cmd = cmd_obj.get("cmd")
+            ret_codes = cmd_obj.get("ret_codes")
+            if cmd is None:
+                Log.error("command '{}' is null in frontend '{}'".format(cmd_name, frontend_name))
+                return None
+
+            try:
+                Log.info("command '{}' ('{}')".format(cmd_name, cmd))
+                ret, out = self.run_cmd(cmd, cmd_name=cmd_name)
+            except Exception as e:
+                Log.error(e)
+                return None
+            else:
+                if ret in ret_codes:
+                    Log.success("command finished")
+                    return out_type(out.strip())
+                else:
+                    Log.error("command failed")
+                    return None
+
+        Log.info("geting info from version control")
+
+        if fields is None:
+            fields = self.VCS_FIELDS
+
+        # Coprocess pays off with more than one query or when it's already
+        # running for the repository (multi-project runs, server).
+        coprocess = None
+        if frontend.get("coproc") is not None:
+            batch_fields = [field for field in fields if frontend.get("get." + field, {}).get("batch") is not None]
+            git_dir = self.find_git_dir(pathlib.Path.cwd())
+            running = git_dir is not None and (frontend.get("coproc").get("cmd"), str(git_dir)) in self.coprocesses
+            if len(batch_fields) > 1 or (len(batch_fields) > 0 and running):
+                coprocess = self.get_coprocess(frontend)
+
+        info = {}
+        info["name"] = frontend_name
+        for field in fields:
+            info[field] = run_wrapper("get." + field, int if field == "commit_count" else str)
+
+        Log.info("finished getting vcs info")
+
+        return info
+
+    def find_work_tree(self, path):
+        # Walk up looking for '.git'.
+        path = pathlib.Path(path).resolve()
+        for directory in [path] + list(path.parents):
+            if (directory / ".git").exists():
+                return directory
+
+        return None
+
+    def find_git_dir(self, path):
+        # '.git' is either directory or file with 'gitdir: <path>'
+        # (worktrees and submodules).
+        work_tree = self.find_work_tree(path)
+        if work_tree is None:
+            return None
+
+        dot_git = work_tree / ".git"
+        if dot_git.is_dir():
+            return dot_git
+
+        try:
+            with open(dot_git, "r", encoding="utf-8") as f:
+                line = f.readline().strip()
+        except IOError:
+            return None
+
+        if line.startswith("gitdir:"):
+            git_dir = pathlib.Path(line[len("gitdir:"):].strip())
+            if not git_dir.is_absolute():
+                git_dir = work_tree / git_dir
+            return git_dir.resolve()
+
+        return None
+
+    def find_common_dir(self, git_dir):
+        # Worktrees share objects and refs with main repository,
+        # 'commondir' file points to it.
+        try:
+            with open(git_dir / "commondir", "r", encoding="utf-8") as f:
+                common_dir = pathlib.Path(f.read().strip())
+        except IOError:
+            return git_dir
+
+        if not common_dir.is_absolute():
+            common_dir = git_dir / common_dir
+        return common_dir.resolve()
+
+    def resolve_git_ref(self, git_dir, common_dir, ref):
+        # Loose ref in worktree or common dir, then packed refs.
+        for directory in [git_dir, common_dir]:
+            try:
+                with open(directory / ref, "r", encoding="utf-8") as f:
+                    return f.read().strip()
+            except IOError:
+                pass
+
+        try:
+            with open(common_dir / "packed-refs", "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref:
+                        return parts[0]
+        except IOError:
+            pass
+
+        return None
+
+    def repo_identity(self, path):
+        # Identifies repository and state of HEAD and tags, without running
+        # vcs. Worktrees with the same HEAD have the same identity.
+        # None if not a git repository or HEAD can't be resolved.
+        git_dir = self.find_git_dir(path)
+        if git_dir is None:
+            return None
+
+        common_dir = self.find_common_dir(git_dir)
+        try:
+            with open(git_dir / "HEAD", "r", encoding="utf-8") as f:
+                head = f.read().strip()
+        except IOError:
+            return None
+
+        if head.startswith("ref:"):
+            commit = self.resolve_git_ref(git_dir, common_dir, head[len("ref:"):].strip())
+        else:
+            commit = head
+        if commit is None:
+            return None
+
+        return [
+            str(common_dir),
+            head,
+            commit,
+            self.tags_state_key(common_dir)
+            ]
+
+    def query_env_vcs_info(self, frontend, frontend_name, wanted_fields=None):
+        # Values from CI environment variables, fields that are not set
+        # come from fallback frontend.
+        info = {"name": frontend_name}
+        for field, var_names in frontend.get("vars", {}).items():
+            for var_name in var_names:
+                value = os.environ.get(var_name)
+                if value:
+                    Log.info("'{}' from environment variable '{}'".format(field, var_name))
+                    info[field] = value
+                    break
+
+        if "short_hash" not in info and "commit_hash" in info:
+            info["short_hash"] = info["commit_hash"][:frontend.get("short_hash_length", DEFAULT_ABBREV_LENGTH)]
+
+        if "commit_count" in info:
+            try:
+                info["commit_count"] = int(info["commit_count"])
+            except ValueError:
+                Log.warn("invalid commit count '{}' in environment".format(info.pop("commit_count")))
+
+        if wanted_fields is None:
+            missing = None
+        else:
+            missing = set(field for field in wanted_fields
+                if field.startswith("vcs.") and field != "vcs.name" and field[len("vcs."):] not in info)
+            if len(missing) == 0:
+                return info
+
+        fallback_name = frontend.get("fallback")
+        if fallback_name is None:
+            Log.warn("fields {} are not set in environment".format(sorted(missing or [])))
+            return info
+
+        # Fields from repository match environment only if HEAD is the
+        # commit environment names, they are left null otherwise.
+        env_commit = info.get("commit_hash")
+        if env_commit is not None and missing is not None:
+            missing.add("vcs.commit_hash")
+
+        Log.info("using fallback frontend '{}' for fields not set in environment".format(fallback_name))
+        fallback = self.check_if_frontend_exists(fallback_name)
+        self.check_if_vcs_is_installed(fallback)
+        fallback_info = self.query_vcs_info(fallback, fallback_name, missing)
+
+        head = fallback_info.get("commit_hash")
+        if env_commit is not None and (head is None or not head.lower().startswith(env_commit.lower())):
+            Log.warn("HEAD '{}' is not commit '{}' from environment, fields {} are left null".format(
+                head, env_commit, sorted(field for field in fallback_info if field not in info)))
+            return info
+
+        fallback_info.update(info)
+        return fallback_info
+
+    def vcs_commands(self, wanted_fields):
+        # Frontend commands needed to cook wanted fields, all if None.
+        commands = set()
+        for field in (self.VCS_FIELD_DEPENDS if wanted_fields is None else wanted_fields):
+            if field.startswith("vcs.submodules."):
+                field = "vcs.submodules"
+            commands.update(self.VCS_FIELD_DEPENDS.get(field, []))
+
+        return commands
+
+    def query_vcs_info(self, frontend, frontend_name, wanted_fields=None):
+        if frontend.get("type") == "env":
+            return self.query_env_vcs_info(frontend, frontend_name, wanted_fields)
+
+        # Only commands wanted fields depend on are run.
+        commands = self.vcs_commands(wanted_fields)
+        fields = [field for field in self.VCS_FIELDS if "get." + field in commands]
+        Log.debug("vcs commands needed: {}".format(sorted(commands)))
+
+        # Vcs info is memoized per repository identity, in memory for
+        # multi-project runs and server and in cache for separate runs.
+        # Memoized info can be partial, missing fields are queried.
+        info = None
+        identity = self.repo_identity(pathlib.Path.cwd())
+        if identity is not None:
+            # Changed frontend commands can give other values.
+            definition = hashlib.sha1(json.dumps(frontend, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            key = json.dumps([frontend_name, definition] + identity)
+            cache_name = "vcs-info-{}.json".format(hashlib.sha1(identity[0].encode("utf-8")).hexdigest()[:16])
+
+            info = self.vcs_memo.get(key)
+            if info is None:
+                cache = self.read_cache(cache_name) or {}
+                info = cache.get(key)
+                if info is not None:
+                    self.vcs_memo[key] = info
+            self.metrics.cache("vcs_info", info is not None)
+            if info is not None:
+                Log.info("using vcs info of repository '{}'".format(identity[0]))
+
+        # Repository found by reading its layout exists, no need to ask vcs.
+        updated = False
+        if info is None:
+            if identity is None:
+                self.check_if_project_repo_exists(frontend)
+            info = {"name": frontend_name}
+
+        missing = [field for field in fields if field not in info]
+        if len(missing) > 0:
+            info = dict(info)
+            info.update(self.get_vcs_info(frontend, frontend_name, missing))
+            updated = True
+
+        # Nearest tag is shared, but computed only when needed.
+        if frontend.get("get.first_parents") is not None and "nearest_tag" not in info:
+            if "get.first_parents" in commands:
+                info = dict(info)
+                info.update(self.get_vcs_nearest_tag(frontend))
+                updated = True
+
+        # Don't remember partial results.
+        if self.vcs_deadline_hit:
+            info = self.fill_missing_vcs_info(info, frontend_name, identity)
+            updated = False
+
+        # Failed fields are not remembered, so they are queried again.
+        if updated and identity is not None:
+            if len(self.vcs_memo) > 256:
+                self.vcs_memo = {}
+            self.vcs_memo[key] = dict((field, value) for field, value in info.items() if value is not None)
+
+            # Keep entries for few recent states (branches, worktrees).
+            cache = self.read_cache(cache_name) or {}
+            cache.pop(key, None)
+            cache[key] = self.vcs_memo[key]
+            while len(cache) > 16:
+                cache.pop(next(iter(cache)))
+            self.write_cache(cache_name, cache)
+
+        # Path info depends on project directory, so it's not shared.
+        # Path index is expensive to build first time, so only if used.
+        if frontend.get("get.path_log") is not None:
+            if "get.path_log" in commands:
+                info = dict(info)
+                info.update(self.get_vcs_path_info(frontend, info["commit_hash"]))
+
+        # Working tree state is per worktree.
+        if frontend.get("get.dirty") is not None:
+            if "get.dirty" in commands:
+                info = dict(info)
+                info["dirty"] = self.get_vcs_dirty(frontend)
+
+        # Submodules can be checked out at other commit than recorded,
+        # so it's not shared as well.
+        if frontend.get("get.gitlinks") is not None:
+            if "get.gitlinks" in commands:
+                info = dict(info)
+                info["submodules"] = self.get_vcs_submodules_info(frontend)
+
+        return info
+
+    def fill_missing_vcs_info(self, info, frontend_name, identity):
+        # Deadline expired, use values from the most recent cached state of
+        # the repository, or leave them null.
+        last = {}
+        if identity is not None:
+            cache_name = "vcs-info-{}.json".format(hashlib.sha1(identity[0].encode("utf-8")).hexdigest()[:16])
+            for key, value in (self.read_cache(cache_name) or {}).items():
+                if json.loads(key)[0] == frontend_name:
+                    last = value
+
+        info = dict(info)
+        for key, value in info.items():
+            if value is None:
+                if last.get(key) is not None:
+                    info[key] = last[key]
+                    Log.warn("vcs deadline exceeded, using last cached value for '{}'".format(key))
+                else:
+                    Log.warn("vcs deadline exceeded, '{}' is null".format(key))
+
+        return info
+
+    def get_build_info(self):
+        return {
+            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+            "time": datetime.datetime.now().strftime("%H:%M:%S")
+            }
+
+    def get_default_info(self):
+        return {
+            "version.major":       0,
+            "version.minor":       1,
+            "version.patch":       0,
+            "version.pre_release": "",
+            "version.string":      "",
+            "vcs.name":            "",
+            "vcs.commit_hash":     "",
+            "vcs.short_hash":      "",
+            "vcs.tag":             "",
+            "vcs.branch":          "",
+            "vcs.commit_count":    0,
+            "vcs.path_commit_hash": "",
+            "vcs.path_commit_count": 0,
+            "vcs.dirty":           False,
+            "vcs.nearest_tag":     "",
+            "vcs.tag_distance":    0,
+            "project.name":        "",
+            "project.copyright":   "",
+            "project.description": "",
+            "project.directory":   "",
+            "build.date":          "",
+            "build.time":          ""
+            }
+
+    def check_if_name_is_valid(self, name):
+        if name.startswith("backends."):
+            bk_name = name[len("backends."):]
+            if len(bk_name) == 0:
+                Log.fatal("backend name can't be empty")
+                raise VerHelError(ExitCodes.INVALID_KEY)
+            else:
+                return bk_name
+        else:
+            empty = self.empty_project()
+            if name not in empty:
+                Log.fatal("'{}' is not a valid name".format(name))
+                raise VerHelError(ExitCodes.INVALID_KEY)
+            else:
+                return name
+
+    def emitted_fields(self, desc):
+        # Fields referenced by project backends and not excluded.
+        exclude = desc.get("exclude") or []
+        fields = set()
+        for backend_desc in desc.get("backends") or []:
+            for bk_name in backend_desc.keys():
+                backend = self.backends.get(bk_name)
+                if backend is not None:
+                    fields.update(self.backend_fields(backend))
+
+        return fields.difference(exclude)
+
+    def backend_fields(self, backend):
+        # Fields backend emits, template loops over fields with prefix
+        # want all fields with that prefix.
+        if backend.get("type") != "template":
+            return [var_name for var_name, _ in self.compile_backend(backend)]
+
+        fields = []
+        for field in self.compile_backend(backend)[1]:
+            if field.endswith("*"):
+                prefix = field[:-1]
+                fields.extend(name for name in self.cookable_fields() if name.startswith(prefix))
+                if prefix.startswith("vcs.submodules.") or "vcs.submodules.".startswith(prefix):
+                    fields.append("vcs.submodules.")
+            else:
+                fields.append(field)
+
+        return fields
+
+    def field_cookers(self, project_name, desc, build_info, vcs_info):
+        # Function computing value for every field that can be cooked.
+        def dget(key, default_value = None):
+            value = desc.get(key)
+            if value is None:
+                if default_value is None:
+                    return self.default_project().get(key)
+                else:
+                    return default_value
+            else:
+                return value
+
+        def version_string():
+            if desc.get("version.pre_release") is not None:
+                string = "{}.{}.{}-{}".format(
+                    desc.get("version.major"),
+                    desc.get("version.minor"),
+                    desc.get("version.patch"),
+                    desc.get("version.pre_release")
+                )
+            else:
+                string = "{}.{}.{}".format(
+                    desc.get("version.major"),
+                    desc.get("version.minor"),
+                    desc.get("version.patch")
+                )
+
+            if desc.get("version.dirty_suffix") is not None and vcs_info.get("dirty"):
+                string += desc.get("version.dirty_suffix")
+
+            return string
+
+        # Each field is cooked only if wanted, all if fields is None.
+        cookers = {
+            # Cook version.
+            "version.major":       lambda: desc.get("version.major"),
+            "version.minor":       lambda: desc.get("version.minor"),
+            "version.patch":       lambda: desc.get("version.patch"),
+            "version.pre_release": lambda: desc.get("version.pre_release") if desc.get("version.pre_release") is not None else "",
+            "version.string":      version_string,
+
+            # Cook rest.
+            "project.name":        lambda: dget("project.name", project_name),
+            "project.author":      lambda: dget("project.author"),
+            "project.license":     lambda: dget("license.spdx"),
+            "project.copyright":   lambda: dget("project.copyright"),
+            "project.company":     lambda: dget("project.company"),
+            "project.description": lambda: dget("project.description"),
+            "project.directory":   lambda: dget("project.directory"),
+            "project.path":        lambda: str(pathlib.Path.cwd().as_posix()),
+            "license.spdx":        lambda: desc.get("license.spdx"),
+            "license.file":        lambda: desc.get("license.file"),
+
+            # Cook build info.
+            "build.date":          lambda: build_info["date"],
+            "build.time":          lambda: build_info["time"],
+
+            # Cook vcs info.
+            "vcs.name":            lambda: dget("frontend"),
+        }
+        for field in self.VCS_FIELD_DEPENDS:
+            cookers.setdefault(field, lambda field=field: vcs_info.get(field[len("vcs."):]))
+
+        return cookers
+
+    def cookable_fields(self):
+        return list(self.field_cookers(None, {}, None, {}).keys())
+
+    def cook_info(self, project_name, desc, build_info, vcs_info, fields=None):
+        cookers = self.field_cookers(project_name, desc, build_info, vcs_info)
+
+        Log.info("cooking info for backend")
+        info = CookedInfo()
+
+        if fields is None:
+            fields = cookers.keys()
+        for field in fields:
+            cooker = cookers.get(field)
+            if cooker is not None:
+                info[field] = cooker()
+
+        for sub_name, sub_info in vcs_info.get("submodules", {}).items():
+            for key, value in sub_info.items():
+                info["vcs.submodules.{}.{}".format(sub_name, key)] = value
+
+        Log.success("cooking finished")
+        Log.debug("cooked info: {}".format(info))
+
+        return info
+
+    def template_key(self, backend):
+        # Template file with its stat, so changed template is compiled
+        # again. None for inline template or if file can't be stat.
+        template_file = backend.get("template")
+        if template_file is None:
+            return None
+        try:
+            st = os.stat(template_file)
+        except OSError:
+            return None
+        else:
+            return (os.path.abspath(template_file), st.st_mtime_ns, st.st_size)
+
+    def compile_backend(self, backend):
+        # Unpack var_map or compile template once, backends are reused
+        # between generate runs in server mode. Templates are compiled
+        # again when their file changes.
+        key = self.template_key(backend) if backend.get("type") == "template" else None
+        cached = self.renderer_cache.get(id(backend))
+        if cached is None or cached[0] != key:
+            if backend.get("type") == "template":
+                plan = self.load_template(backend)
+            else:
+                plan = [next(iter(var.items())) for var in backend.get("var_map")]
+            cached = (key, plan)
+            self.renderer_cache[id(backend)] = cached
+
+        return cached[1]
+
+    def private_cache_directory(self):
+        # Per user cache directory only its owner can write, so compiled
+        # code loaded from it can be trusted. None if that can't be
+        # ensured, e.g. on non posix systems.
+        if os.name != "posix":
+            return None
+        try:
+            base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+            directory = pathlib.Path(base) / "verhel" / "templates"
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            st = os.stat(directory)
+        except (OSError, RuntimeError):
+            return None
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            Log.warn("cache directory '{}' is not private, not caching templates".format(directory))
+            return None
+        return directory
+
+    def load_template(self, backend):
+        # Returns render function and fields template references. Compiled
+        # code is cached in private per user directory by hash of template
+        # text, so touched or copied template still hits the cache.
+        template_file = backend.get("template")
+        try:
+            if template_file is not None:
+                with open(template_file, encoding="utf-8") as f:
+                    text = f.read()
+            else:
+                text = backend["template.text"]
+        except OSError as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to read template '{}'".format(template_file))
+            raise VerHelError(ExitCodes.INVALID_CATALOG)
+
+        cache_file = None
+        cache_directory = self.private_cache_directory() if self.cache_directory is not None else None
+        if cache_directory is not None:
+            key = "{}\0{}\0{}".format(TEMPLATE_FORMAT, sys.implementation.cache_tag, text)
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+            cache_file = cache_directory / "{}.bin".format(digest)
+
+        compiled = None
+        if cache_file is not None:
+            try:
+                with open(cache_file, "rb") as f:
+                    if os.fstat(f.fileno()).st_uid == os.getuid():
+                        compiled = marshal.load(f)
+            except (OSError, EOFError, ValueError, TypeError):
+                pass
+            if compiled is not None:
+                Log.debug("using compiled template '{}'".format(cache_file))
+            self.metrics.cache("template", compiled is not None)
+
+        if compiled is None:
+            try:
+                code, fields = compile_template(text, template_file or "<template>")
+            except TemplateError as e:
+                Log.error("{}".format(e))
+                Log.fatal("failed to compile template '{}'".format(template_file or "<template>"))
+                raise VerHelError(ExitCodes.INVALID_CATALOG)
+
+            compiled = (code, tuple(fields))
+            if cache_file is not None:
+                try:
+                    write_file_atomic(cache_file, marshal.dumps(compiled))
+                except OSError as e:
+                    Log.warn("failed to write compiled template '{}': {}".format(cache_file, e))
+
+        namespace = {"_filter": template_filter, "_str": template_str}
+        exec(compiled[0], namespace)
+        return namespace["render"], list(compiled[1])
+
+    def render_template(self, backend, cooked_info, license_text, excluded_vars):
+        render, _ = self.compile_backend(backend)
+
+        def get(name):
+            if name in excluded_vars:
+                return None
+            if name == "license.text":
+                return license_text
+            return cooked_info.get(name)
+
+        def items(prefix):
+            return [(name, value) for name, value in sorted(cooked_info.items())
+                if name.startswith(prefix) and value is not None and name not in excluded_vars]
+
+        return render(get, items)
+
+    def backend_generate(self, backend, cooked_info, license_text, excluded_vars=[]):
+        if backend.get("type") == "template":
+            return self.render_template(backend, cooked_info, license_text, excluded_vars)
+
+        fmtr = self.formatter
+        ss = io.StringIO()
+        format_bool    = backend.get("format.bool")
+        format_number  = backend.get("format.number")
+        format_string  = backend.get("format.string")        
+        if format_bool is None:
+            format_bool = format_number if format_number is not None else format_string
+        format_var     = backend.get("format.var")        
+        source_begin   = backend.get("source.begin") 
+        source_comment = backend.get("source.comment") 
+        source_end     = backend.get("source.end") 
+
+        # Write beginning.
+        if license_text is not None:
+            license_commented = ""
+            for line in license_text.rstrip().splitlines():
+                license_commented += ("{} {}\n".format(source_comment, line))
+            ss.write(license_commented)
+        if cooked_info.get("license.spdx") is not None: 
+            if license_text is not None:
+                ss.write("{}\n".format(source_comment))
+            ss.write("{} SPDX-License-Identifier: {}\n".format(source_comment, cooked_info["license.spdx"]))
+        
+        ss.write(source_begin)
+
+        # Write variables
+        for var_name, emit_name in self.compile_backend(backend):
+
+            # Check if value is excluded.
+            if var_name in excluded_vars:
+                continue
+
+            # Emit value.
+            value = cooked_info.get(var_name)
+            if value is not None:
+                _ty = type(value)
+                if _ty is bool:
+                    ss.write(fmtr.format(format_bool, emit_name, str(value).lower()))
+                elif _ty is int or _ty is float:
+                    ss.write(fmtr.format(format_number, emit_name, value))
+                elif _ty is str:
+                    #ss.write(format_string.format(emit_name, value))
+                    ss.write(fmtr.format(format_string, emit_name, value))
+                else:
+                    Log.warn("don't know how to write type '{}, writing as string'".format(_ty.__name__))
+                    ss.write(fmtr.format(format_string, emit_name, value))
+            else:
+                Log.warn("emiting value '{}' is null".format(var_name))
+
+        # Write ending.
+        ss.write(source_end)
+        ss.write("\n{0} generated using verhel.py {0}\n".format(source_comment))
+
+        return ss.getvalue()
+
+    def verhel_generate_sources(self, project_name, desc, vcs_info, build_info=None):
+        # Get build info.
+        if build_info is None:
+            build_info = self.get_build_info()
+
+        # Only fields backends emit are cooked, license is in every header
+        # unless excluded.
+        exclude = desc.get("exclude")
+        if exclude is None:
+            exclude = []
+        wanted_fields = self.emitted_fields(desc)
+        wanted_fields.update(set(["license.spdx"]).difference(exclude))
+
+        # Read license.
+        license_text = None
+        if desc["license.file"] is not None and "license.file" not in exclude:
+            try:
+                with open(desc["license.file"], encoding="utf-8") as f:
+                    license_buffer = f.read()
+            except IOError as e:
+                Log.error("failed to load license file '{}'".format(desc["license.file"]))
+                pass
+            else:
+                license_text = license_buffer
+
+        # Cook info.
+        with self.metrics.phase("cook"):
+            cooked_info = self.cook_info(project_name, desc, build_info, vcs_info, wanted_fields)
+
+        Log.info("running generate for project '{}'...".format(project_name))
+
+        # Render all outputs first.
+        outputs = []
+        with self.metrics.phase("render"):
+            for backend_desc in desc.get("backends"):
+                for bk_name, bk_output in backend_desc.items():
+                    backend = self.backends.get(bk_name)
+                    if backend is not None:
+                        Log.info("    generating source using '{}' backend".format(bk_name))
+                        buffer = self.backend_generate(backend, cooked_info, license_text, exclude)
+                        outputs.append((bk_name, pathlib.Path(bk_output), buffer))
+                    else:
+                        Log.error("    backend '{}' is not implemented".format(bk_name))
+
+        # Create each output directory once.
+        for directory in set(output_path.parent for _, output_path, _ in outputs):
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                Log.error("    can't create directory '{}'".format(directory))
+                Log.error("    {}".format(e))
+
+        # Write outputs in parallel.
+        start = time.perf_counter()
+        results = write_files_atomic([(output_path, buffer) for _, output_path, buffer in outputs], self.jobs, self.fsync)
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("verhel_phase_duration_seconds", elapsed, phase="write")
+
+        # Summary.
+        num_success = 0
+        num_unchanged = 0
+        total_bytes = 0
+        for (bk_name, output_path, _), (result, seconds) in zip(outputs, results):
+            if isinstance(result, Exception):
+                Log.error("    can't open or write '{}'".format(output_path))
+                Log.error("    {}".format(result))
+                self.metrics.inc("verhel_outputs_failed_total", backend=bk_name)
+            elif result is None:
+                Log.success("    '{}' unchanged ({:.1f} ms, {})".format(output_path, seconds * 1000, bk_name))
+                num_success += 1
+                num_unchanged += 1
+                self.metrics.inc("verhel_outputs_unchanged_total", backend=bk_name)
+            else:
+                Log.success("    successfully wrote '{}' ({} b, {:.1f} ms, {})".format(output_path, result, seconds * 1000, bk_name))
+                num_success += 1
+                total_bytes += result
+                self.metrics.inc("verhel_outputs_written_total", backend=bk_name)
+                self.metrics.inc("verhel_output_bytes_written_total", result, backend=bk_name)
+
+        Log.info("    wrote {} b to {} outputs, {} unchanged, in {:.1f} ms{}".format(
+            total_bytes, num_success - num_unchanged, num_unchanged, elapsed * 1000, " (fsync)" if self.fsync else ""))
+
+        return num_success
+
+    def process_arguments(self, args, cmd):
+        # Color output.
+        global USE_COLOR_OUTPUT
+        USE_COLOR_OUTPUT = args.color_output
+
+        # Verbosity level.
+        if args.quiet == True:
+            self.log_bk_console.set_log_level(LogType.FATAL + 1)
+        else:
+            if args.verbose == 0:
+                lvl = LogType.FATAL
+            elif args.verbose == 1:
+                lvl = LogType.SUCCESS
+            elif args.verbose == 2:
+                lvl = LogType.INFO
+            else:
+                lvl = LogType.DEBUG
+            
+            self.log_bk_console.set_log_level(lvl)
+            self.log_bk_file.set_log_level(lvl)
+
+        Log.debug("command line arguments:")
+
+        # Print debug info.
+        Log.debug("quiet='{}'".format(args.quiet))
+        Log.debug("verbose='{}'".format(args.verbose))
+        Log.debug("color_output='{}'".format(args.color_output))
+        if cmd in ["init", "generate", "delete", "info", "get", "set", "validate", "list_projects", "snapshot", "batch", "install-hooks"]:
+            Log.debug("project_file='{}'".format(args.projects_file))
+
+        if cmd in ["init", "generate", "delete", "info", "get", "set", "validate", "snapshot", "batch", "install-hooks"]:
+            Log.debug("project_name='{}'".format(args.project))
+
+        if cmd in ["info", "list_projects", "list_frontends", "list_backends"]:
+            Log.debug("format='{}'".format(args.format))
+            Log.debug("fields='{}'".format(args.fields))
+
+        if cmd in ["list_projects", "list_frontends", "list_backends"]:
+            Log.debug("match='{}'".format(args.match))
+        
+        if cmd in ["generate"]:
+            self.emit_default_values = args.emit_default
+            self.jobs = max(1, args.jobs)
+            self.fsync = args.fsync
+            self.check_stamp = args.check_stamp
+            self.fatal_if_bk_not_impl = args.fatal_if_backend_not_impl
+
+            Log.debug("all='{}'".format(args.all))
+            Log.debug("discover='{}'".format(args.discover))
+            Log.debug("jobs='{}'".format(args.jobs))
+            Log.debug("fsync='{}'".format(args.fsync))
+            Log.debug("metrics_file='{}'".format(args.metrics_file))
+            Log.debug("vcs_deadline='{}'".format(args.vcs_deadline))
+            Log.debug("vcs_info_from='{}'".format(args.vcs_info_from))
+            Log.debug("glob_desc_name='{}'".format(args.global_desc_name))
+            Log.debug("emit_default='{}'".format(args.emit_default))
+            Log.debug("fatal_if_backend_not_impl='{}'".format(args.fatal_if_backend_not_impl))
+
+        if cmd in ["get", "set"]:
+            Log.debug("property_name='{}'".format(args.property_name))
+
+        if cmd in ["init", "delete", "set", "batch"]:
+            self.wait_timeout = args.wait_timeout
+            Log.debug("wait_timeout='{}'".format(args.wait_timeout))
+
+        if cmd in ["snapshot"]:
+            Log.debug("output='{}'".format(args.output))
+
+        if cmd in ["generate", "list_frontends", "snapshot", "update", "install-hooks"]:
+            Log.debug("frontends_file='{}'".format(args.frontends_file))
+
+        if cmd in ["generate", "list_backends", "update", "install-hooks"]:
+            Log.debug("backends_file='{}'".format(args.backends_file))
+
+        if cmd in ["serve"]:
+            Log.debug("socket='{}'".format(args.socket))
+
+        if cmd in ["update"]:
+            Log.debug("output='{}'".format(args.output))
+
+    def init(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "init")
+        project_name = args.project
+        projects_file = args.projects_file
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+        
+        Log.info("running init command")
+
+        try:
+            with self.projects_lock(projects_file, project_name):
+                # If project description file exists, try load the project.
+                if pathlib.Path(projects_file).exists():
+                    self.load_projects(projects_file, [project_name])
+
+                    # Check name collision.
+                    for name, _ in self.projects.items():
+                        if name == project_name:
+                            Log.fatal("project '{}' already exists".format(project_name))
+                            return ExitCodes.PROJECT_ALREADY_EXISTS
+
+                # Add new project.
+                new_desc = ProjectDesc(self.empty_project())
+                self.projects[project_name] = new_desc
+                
+                # Update projects file.
+                self.save_projects(projects_file, [project_name])
+        except VerHelError as e:
+            return e.error_code
+
+        Log.success("successfully added new project '{}'".format(project_name))
+
+        return ExitCodes.SUCCESS
+
+    def load_snapshot(self, file_name):
+        Log.info("loading vcs snapshot from '{}'".format(file_name))
+
+        try:
+            root = self.load_from_file(file_name)
+            if not isinstance(root, (dict, SparseRecord)) or not isinstance(root.get("vcs"), (dict, SparseRecord)):
+                raise ValueError("snapshot doesn't contain 'vcs' object")
+        except Exception as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to load vcs snapshot")
+            raise VerHelError(ExitCodes.FAILED_TO_LOAD_SNAPSHOT)
+
+        self.vcs_snapshot_key = self.file_stat_key(file_name)
+        Log.success("loaded vcs snapshot of project '{}'".format(root.get("project")))
+        return root
+
+    def snapshot(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "snapshot")
+        project_name = args.project
+        projects_file = args.projects_file
+        frontends_file = args.frontends_file
+        glob_desc_name = args.global_desc_name
+        output = os.path.abspath(args.output)
+
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+        self.cache_directory = self.state_directory(projects_file) / "cache"
+
+        Log.info("running snapshot command")
+
+        # Load project, frontend and get vcs info from project directory.
+        cwd = os.getcwd()
+        try:
+            self.load_projects(projects_file, [project_name, glob_desc_name or self.GLOBAL_DESC_NAME])
+            self.check_if_project_exists(project_name)
+            desc = self.resolve_project(project_name, glob_desc_name)
+
+            vcs = desc.get("frontend")
+            vcs_info = {}
+            if vcs is not None:
+                self.load_frontends(frontends_file)
+                frontend = self.check_if_frontend_exists(vcs)
+                self.check_if_vcs_is_installed(frontend)
+                self.cd_into_project_directory(desc)
+                vcs_info = self.query_vcs_info(frontend, vcs)
+            else:
+                Log.warn("project '{}' doesn't use frontend".format(project_name))
+        except VerHelError as e:
+            return e.error_code
+        finally:
+            os.chdir(cwd)
+
+        snapshot = {
+            "project": project_name,
+            "frontend": vcs,
+            "vcs": vcs_info,
+            "build": self.get_build_info()
+            }
+
+        try:
+            write_file_atomic(output, json.dumps(snapshot, indent=4))
+        except IOError as e:
+            Log.error("failed to write '{}'".format(output))
+            Log.error("{}".format(e))
+            return ExitCodes.FAILED_TO_SAVE_SNAPSHOT
+
+        Log.success("wrote vcs snapshot '{}'".format(output))
+        Log.info("snapshot command finished")
+        return ExitCodes.SUCCESS
+
+    def state_directory(self, projects_file):
+        # Locks and caches are kept next to the projects file.
+        return self.make_state_directory(pathlib.Path(os.path.abspath(projects_file)).parent)
+
+    def make_state_directory(self, directory):
+        # State directory ignores all its content, so it doesn't show up as
+        # untracked in repository of the user. Created once per directory.
+        state_directory = pathlib.Path(directory) / self.STATE_DIRECTORY_NAME
+        if state_directory not in self.state_directories:
+            ignore_file = state_directory / ".gitignore"
+            try:
+                state_directory.mkdir(parents=True, exist_ok=True)
+                if not ignore_file.exists():
+                    write_file_atomic(ignore_file, "*\n")
+            except OSError as e:
+                Log.warn("failed to create state directory '{}': {}".format(state_directory, e))
+            self.state_directories.add(state_directory)
+        return state_directory
+
+    def project_lock(self, projects_file, project_name):
+        # Lock file name is readable project name and hash of full
+        # projects file path and project name, so it's unique.
+        key = "{}\0{}".format(os.path.abspath(projects_file), project_name)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in project_name)
+        lock_file = self.state_directory(projects_file) / "locks" / "{}-{}.lock".format(safe_name, digest)
+        return FileLock(lock_file)
+
+    @contextlib.contextmanager
+    def projects_lock(self, projects_file, project_name):
+        # Exclusive lock for read-modify-write of projects file, or of
+        # project shard, so concurrent writers don't lose updates.
+        key = os.path.abspath(projects_file)
+        if self.is_sharded(projects_file):
+            key += "\0" + project_name
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        lock = FileLock(self.state_directory(projects_file) / "locks" / "projects-{}.lock".format(digest))
+
+        try:
+            if not lock.acquire(self.wait_timeout):
+                Log.info("waited for lock of '{}'".format(projects_file))
+        except TimeoutError:
+            Log.fatal("timed out waiting for lock of '{}'".format(projects_file))
+            raise VerHelError(ExitCodes.LOCK_TIMEOUT)
+        except OSError as e:
+            Log.warn("failed to lock projects, modifying without lock: {}".format(e))
+            lock = None
+
+        try:
+            yield
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def read_prune_patterns(self, directory):
+        # Gitignore style patterns, negation is not supported. Patterns
+        # with slash are relative to directory, rest match entry name.
+        patterns = []
+        try:
+            with open(os.path.join(directory, self.IGNORE_FILE_NAME), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            return patterns
+
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#") or line.startswith("!"):
+                continue
+
+            pattern = line.rstrip("/")
+            if "/" in pattern:
+                patterns.append([directory, pattern.lstrip("/")])
+            else:
+                patterns.append([None, pattern])
+
+        return patterns
+
+    def is_pruned(self, entry, patterns):
+        for base, pattern in patterns:
+            if base is None:
+                if fnmatch.fnmatchcase(entry.name, pattern):
+                    return True
+            else:
+                relative = os.path.relpath(entry.path, base).replace(os.sep, "/")
+                if fnmatch.fnmatchcase(relative, pattern):
+                    return True
+
+        return False
+
+    def scan_directory(self, directory, patterns, cached=None):
+        # Returns scan of directory, mtimes of directory and its ignore
+        # file, patterns, found projects files and subdirectories. Cached
+        # scan is reused if mtimes and patterns didn't change.
+        mtime = os.stat(directory).st_mtime_ns
+        ignore_file = os.path.join(directory, self.IGNORE_FILE_NAME)
+        try:
+            ignore_mtime = os.stat(ignore_file).st_mtime_ns
+        except OSError:
+            ignore_mtime = None
+
+        if (cached is not None and cached["mtime"] == mtime and
+                cached["ignore_mtime"] == ignore_mtime and cached["patterns"] == patterns):
+            return cached, True
+
+        found = []
+        subdirectories = []
+        entry_patterns = patterns
+        if ignore_mtime is not None:
+            entry_patterns = patterns + self.read_prune_patterns(directory)
+        with os.scandir(directory) as it:
+            for entry in it:
+                if self.is_pruned(entry, entry_patterns):
+                    continue
+
+                if entry.name == self.PROJECTS_DEFAULT_FILE_NAME and entry.is_file():
+                    found.append(entry.path)
+                elif entry.is_dir(follow_symlinks=False):
+                    if entry.name == self.PROJECTS_DEFAULT_DIRECTORY_NAME:
+                        found.append(entry.path)
+                    elif entry.name not in self.DISCOVER_PRUNED_NAMES:
+                        subdirectories.append(entry.path)
+
+        # Sharded directory is used only if there is no projects file.
+        if len(found) == 2:
+            found = [f for f in found if os.path.basename(f) == self.PROJECTS_DEFAULT_FILE_NAME]
+
+        return {
+            "mtime": mtime,
+            "ignore_mtime": ignore_mtime,
+            "patterns": patterns,
+            "subdirectory_patterns": entry_patterns,
+            "found": found,
+            "subdirectories": sorted(subdirectories)
+            }, False
+
+    def discover_projects_files(self, root, max_depth, prunes):
+        # Directories are scanned level by level in parallel. Scans are
+        # cached, directory is scanned again only if its mtime or mtime of
+        # its ignore file changed.
+        root = os.path.abspath(root)
+        key = json.dumps([root, max_depth, sorted(prunes)])
+        cache_file = None
+        cached = {}
+        if self.cache_directory is not None:
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            cache_file = self.cache_directory / "discover-{}.json".format(digest)
+            try:
+                with open(cache_file, encoding="utf-8") as f:
+                    cached = json.load(f)["directories"]
+            except (OSError, ValueError, KeyError, TypeError):
+                cached = {}
+
+        Log.info("discovering projects files in '{}'".format(root))
+        directories = {}
+        projects_files = []
+        num_scanned = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            level = [(root, [[None, prune] for prune in prunes])]
+            depth = 0
+            while len(level) > 0:
+                futures = [pool.submit(self.scan_directory, d, p, cached.get(d)) for d, p in level]
+                next_level = []
+                for (directory, _), future in zip(level, futures):
+                    try:
+                        scan, from_cache = future.result()
+                    except OSError as e:
+                        Log.warn("failed to scan '{}': {}".format(directory, e))
+                        continue
+
+                    if not from_cache:
+                        num_scanned = num_scanned + 1
+                    directories[directory] = scan
+                    projects_files.extend(scan["found"])
+                    if depth < max_depth:
+                        next_level.extend((d, scan["subdirectory_patterns"]) for d in scan["subdirectories"])
+
+                level = next_level
+                depth = depth + 1
+
+        projects_files.sort()
+        Log.success("discovered {} projects files in {} directories ({} scanned)".format(
+            len(projects_files), len(directories), num_scanned))
+
+        # Cache is written after the run, see refresh_discover_cache.
+        self.discover_cache = (cache_file, key, directories, num_scanned > 0)
+        return projects_files
+
+    def refresh_discover_cache(self):
+        # Workers write outputs and state directories, which changes mtimes
+        # of scanned directories. Changed directories are scanned again
+        # after the run and their new mtime is kept if they still have the
+        # same projects files and subdirectories, so the tool's own writes
+        # don't invalidate the cache of next run.
+        cache_file, key, directories, changed = self.discover_cache
+        self.discover_cache = None
+        if cache_file is None:
+            return
+
+        def rescan(directory):
+            scan = directories[directory]
+            try:
+                return self.scan_directory(directory, scan["patterns"], scan)
+            except OSError:
+                return scan, True
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            rescans = list(pool.map(rescan, list(directories)))
+        for directory, (scan, from_cache) in zip(list(directories), rescans):
+            old = directories[directory]
+            if not from_cache and scan["found"] == old["found"] and scan["subdirectories"] == old["subdirectories"]:
+                directories[directory] = scan
+                changed = True
+
+        if changed:
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                write_file_atomic(cache_file, json.dumps({"key": key, "directories": directories}))
+            except OSError as e:
+                Log.warn("failed to cache discovery: {}".format(e))
+
+    def generate_discovered(self, args, projects_files):
+        # Each projects file is generated by worker process started in its
+        # directory, like generate --all run from there.
+        argv = [sys.executable, entry_script()]
+        if args.quiet:
+            argv.append("--quiet")
+        else:
+            argv.extend(["--verbose", str(args.verbose)])
+        if args.color_output:
+            argv.append("--color-output")
+        argv.extend(["generate", "--all", "--jobs", "1"])
+        for option, value in [
+            ("--frontends-file", args.frontends_file),
+            ("--backends-file", args.backends_file),
+            ("--vcs-info-from", args.vcs_info_from)
+            ]:
+            if value is not None:
+                argv.extend([option, os.path.abspath(value)])
+        if args.global_desc_name is not None:
+            argv.extend(["--global-desc-name", args.global_desc_name])
+        if args.vcs_deadline is not None:
+            argv.extend(["--vcs-deadline", str(args.vcs_deadline)])
+        if args.emit_default:
+            argv.append("--emit-default")
+        if args.fsync:
+            argv.append("--fsync")
+        if not args.fatal_if_backend_not_impl:
+            argv.append("--fatal-if-backend-not-impl")
+
+        # Workers write their metrics to state directory of the projects
+        # file, generated projects are counted from them.
+        def metrics_file(projects_file):
+            return self.state_directory(projects_file) / "cache" / "discover-metrics-{}.prom".format(os.getpid())
+
+        def run_worker(projects_file):
+            metrics_file(projects_file).parent.mkdir(parents=True, exist_ok=True)
+            proc = subprocess.run(
+                argv + ["--projects-file", os.path.basename(projects_file), "--metrics-file", str(metrics_file(projects_file))],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=os.path.dirname(projects_file)
+                )
+            return proc.returncode, proc.stdout
+
+        def count_projects(projects_file):
+            try:
+                with open(metrics_file(projects_file), encoding="utf-8") as f:
+                    for line in f:
+                        match = re.fullmatch(r'verhel_projects_total\{result="(\w+)"\} (\d+)', line.strip())
+                        if match is not None:
+                            self.metrics.inc("verhel_projects_total", int(match.group(2)), result=match.group(1))
+                os.unlink(metrics_file(projects_file))
+            except OSError as e:
+                Log.warn("failed to read worker metrics: {}".format(e))
+
+        ret = ExitCodes.SUCCESS
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for projects_file, future in zip(projects_files, [pool.submit(run_worker, f) for f in projects_files]):
+                try:
+                    worker_ret, output = future.result()
+                except OSError as e:
+                    Log.error("failed to start worker: {}".format(e))
+                    worker_ret, output = ExitCodes.WORKER_FAILED, b""
+                if worker_ret < 0:
+                    worker_ret = ExitCodes.WORKER_FAILED
+                count_projects(projects_file)
+
+                # Output of worker is written at once, so it's not mixed.
+                # Written as text, stdout is captured in server mode.
+                sys.stdout.write(output.decode("utf-8", errors="replace"))
+                sys.stdout.flush()
+
+                if worker_ret == ExitCodes.SUCCESS:
+                    Log.success("generated projects from '{}'".format(projects_file))
+                else:
+                    Log.error("failed to generate projects from '{}'".format(projects_file))
+                    if ret == ExitCodes.SUCCESS:
+                        ret = worker_ret
+
+        return ret
+
+    def generate(self, args):
+        # Metrics are collected for each run and written when it finishes,
+        # even if it failed.
+        self.metrics = Metrics()
+        start = time.perf_counter()
+        try:
+            return self.generate_command(args)
+        finally:
+            self.metrics.observe("verhel_phase_duration_seconds", time.perf_counter() - start, phase="total")
+            if args.metrics_file is not None:
+                try:
+                    write_file_atomic(args.metrics_file, self.metrics.render())
+                except OSError as e:
+                    Log.error("failed to write metrics file '{}': {}".format(args.metrics_file, e))
+
+    def generate_command(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "generate")
+        project_name = args.project
+        projects_file = args.projects_file
+        frontends_file = args.frontends_file
+        backends_file = args.backends_file
+        glob_desc_name = args.global_desc_name
+
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+        self.cache_directory = self.state_directory(projects_file) / "cache"
+
+        # Deadline is per run, server runs many.
+        self.vcs_deadline = None
+        self.vcs_deadline_hit = False
+        self.abbrev_lengths = {}
+        if args.vcs_deadline is not None:
+            self.vcs_deadline = time.monotonic() + args.vcs_deadline / 1000
+
+        Log.info("running generate command")
+
+        # Snapshot is per run, server runs many.
+        self.vcs_snapshot = None
+        self.vcs_snapshot_key = None
+        if args.vcs_info_from is not None:
+            try:
+                self.vcs_snapshot = self.load_snapshot(args.vcs_info_from)
+            except VerHelError as e:
+                return e.error_code
+
+        if args.discover is not None:
+            self.cache_directory = self.make_state_directory(os.path.abspath(args.discover)) / "cache"
+            with self.metrics.phase("discover"):
+                projects_files = self.discover_projects_files(args.discover, args.max_depth, args.prune or [])
+            ret = self.generate_discovered(args, projects_files)
+            self.refresh_discover_cache()
+        elif not args.all:
+            if project_name is None:
+                Log.fatal("project name, --all or --discover is required")
+                return ExitCodes.PROJECT_DOESNT_EXISTS
+
+            ret = self.generate_single_flight(project_name, projects_file, frontends_file, backends_file, glob_desc_name)
+            self.metrics.inc("verhel_projects_total", result="success" if ret == ExitCodes.SUCCESS else "failed")
+        else:
+            # Projects are loaded once, vcs info is shared between
+            # projects from the same repository.
+            with self.metrics.phase("load_projects"):
+                try:
+                    self.load_projects(projects_file)
+                except VerHelError as e:
+                    return e.error_code
+
+            ret = ExitCodes.SUCCESS
+            for name in list(self.projects.keys()):
+                if name == self.GLOBAL_DESC_NAME or name == glob_desc_name:
+                    continue
+
+                Log.info("generating project '{}'".format(name))
+                project_ret = self.generate_single_flight(name, projects_file, frontends_file, backends_file, glob_desc_name, False)
+                self.metrics.inc("verhel_projects_total", result="success" if project_ret == ExitCodes.SUCCESS else "failed")
+                if project_ret != ExitCodes.SUCCESS and ret == ExitCodes.SUCCESS:
+                    ret = project_ret
+
+        Log.info("generate command finished")
+        return ret
+
+    def generate_single_flight(self, project_name, projects_file, frontends_file, backends_file, glob_desc_name, load=True):
+        # Single flight, only one process generates the project at a time.
+        # Processes that had to wait reuse the result if it was produced
+        # from the same input files while they were waiting.
+        inputs = json.dumps([
+            self.projects_stat_key(projects_file, [project_name, glob_desc_name or self.GLOBAL_DESC_NAME]),
+            self.catalog_key(frontends_file),
+            self.catalog_key(backends_file),
+            self.vcs_snapshot_key,
+            glob_desc_name,
+            self.emit_default_values
+            ])
+        lock = self.project_lock(projects_file, project_name)
+
+        # Fast path for builds, when hooks keep generated sources up to
+        # date, stamp of last run is enough (see install-hooks command).
+        if self.check_stamp:
+            try:
+                stamp = json.loads(pathlib.Path(lock.file_name).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                stamp = {}
+
+            current = self.stamp_is_current(stamp, inputs, projects_file) and stamp.get("ret") == ExitCodes.SUCCESS
+            self.metrics.cache("stamp", current)
+            if current:
+                Log.success("project '{}' is up to date with stamp, skipping".format(project_name))
+                return ExitCodes.SUCCESS
+        wait_start = time.time()
+        try:
+            got_immediately = lock.acquire()
+        except OSError as e:
+            Log.warn("failed to lock project, generating without lock: {}".format(e))
+            lock = None
+            got_immediately = True
+
+        try:
+            if not got_immediately:
+                try:
+                    stamp = json.loads(lock.read())
+                except ValueError:
+                    stamp = {}
+
+                current = stamp.get("finished", 0) >= wait_start and self.stamp_is_current(stamp, inputs, projects_file)
+                self.metrics.cache("single_flight", current)
+                if current:
+                    Log.info("project '{}' was generated by concurrent process, reusing result".format(project_name))
+                    return stamp.get("ret", ExitCodes.SUCCESS)
+
+            cwd = os.getcwd()
+            self.stamp_deps = None
+            try:
+                ret = self.generate_project(project_name, projects_file, frontends_file, backends_file, glob_desc_name, load)
+            finally:
+                os.chdir(cwd)
+
+            if lock is not None:
+                chain = self.resolved_chains.get((project_name, glob_desc_name), [project_name])
+                lock.write(json.dumps({
+                    "finished": time.time(),
+                    "ret": ret,
+                    "inputs": inputs,
+                    "chain": chain,
+                    "chain_key": self.chain_stat_key(projects_file, chain),
+                    "deps": self.stamp_deps
+                    }))
+        finally:
+            if lock is not None:
+                lock.release()
+
+        return ret
+
+    def stamp_is_current(self, stamp, inputs, projects_file):
+        # Stamp matches if it was written from the same inputs and no shard
+        # of the resolved inheritance chain changed since it was loaded.
+        chain = stamp.get("chain")
+        if stamp.get("inputs") != inputs or type(chain) is not list or not all(type(name) is str for name in chain):
+            return False
+        if stamp.get("chain_key") != self.chain_stat_key(projects_file, chain, current=True):
+            return False
+
+        # Nor the repository or files generated sources depend on.
+        deps = stamp.get("deps")
+        if type(deps) is not dict or type(deps.get("directory")) is not str or type(deps.get("files")) is not list:
+            return False
+        if not all(type(file_name) is str for file_name in deps["files"]):
+            return False
+        return deps.get("key") == self.stamp_deps_key(deps)
+
+    def project_deps(self, desc):
+        # Repository of project directory, license and template files the
+        # generated sources depend on, with their state before generating.
+        # Stamp checks them without loading projects.
+        files = []
+        if desc.get("license.file") is not None:
+            files.append(os.path.abspath(desc["license.file"]))
+        for bk in desc.get("backends") or []:
+            for name in bk:
+                backend = self.backends.get(name)
+                if backend is not None and backend.get("template") is not None:
+                    files.append(os.path.abspath(backend["template"]))
+
+        deps = {"directory": os.getcwd(), "files": files}
+        deps["key"] = self.stamp_deps_key(deps)
+        return deps
+
+    def stamp_deps_key(self, deps):
+        return json.dumps([
+            self.repo_identity(deps["directory"]),
+            [self.file_stat_key(file_name) for file_name in deps["files"]]
+            ])
+
+    def generate_project(self, project_name, projects_file, frontends_file, backends_file, glob_desc_name, load=True):
+        # Load project and validate.
+        with self.metrics.phase("load_projects"):
+            try:
+                if load:
+                    self.load_projects(projects_file, [project_name, glob_desc_name or self.GLOBAL_DESC_NAME])
+                self.check_if_project_exists(project_name)
+                desc = self.resolve_project(project_name, glob_desc_name)
+
+                self.validate_version(desc)
+            except VerHelError as e:
+                return e.error_code
+
+        # Load backends if project uses one.
+        backends_list = desc.get("backends")
+        if backends_list is not None and len(backends_list) > 0:
+            with self.metrics.phase("load_backends"):
+                try:
+                    self.load_backends(backends_file)
+                    self.check_if_backends_exists(backends_list)
+                except VerHelError as e:
+                    return e.error_code
+        else:
+            Log.warn("no backends found in project '{}'".format(project_name))
+            Log.info("nothing to do, terminating")
+            return ExitCodes.SUCCESS
+
+        # Only fields backends emit are computed. Templates are compiled
+        # to find their fields, which may fail.
+        try:
+            wanted_fields = self.emitted_fields(desc)
+        except VerHelError as e:
+            return e.error_code
+        if desc.get("version.dirty_suffix") is not None and "version.string" in wanted_fields:
+            wanted_fields.add("vcs.dirty")
+
+        # Load frontends if project uses one and any vcs field is wanted.
+        # Not needed when vcs info comes from snapshot.
+        vcs = desc.get("frontend")
+        if vcs is not None and len(self.vcs_commands(wanted_fields)) == 0:
+            Log.info("no vcs fields wanted, skipping frontend '{}'".format(vcs))
+            vcs = None
+        if vcs is not None and self.vcs_snapshot is None:
+            with self.metrics.phase("load_frontends"):
+                try:
+                    self.load_frontends(frontends_file)
+                    frontend = self.check_if_frontend_exists(vcs)
+                    self.check_if_vcs_is_installed(frontend)
+                except VerHelError as e:
+                    return e.error_code
+
+        # Change current directory to project root directory.
+        # So all the commands are exucuted there.
+        try:
+            self.cd_into_project_directory(desc)
+        except VerHelError as e:
+            return e.error_code
+        self.stamp_deps = self.project_deps(desc)
+
+        # Get information from Version Control System.
+        vcs_info = {}
+        build_info = None
+        if self.vcs_snapshot is not None:
+            Log.info("using vcs info from snapshot")
+            vcs_info = self.vcs_snapshot.get("vcs", {})
+            build_info = self.vcs_snapshot.get("build")
+        elif vcs is not None:
+            with self.metrics.phase("vcs"):
+                try:
+                    vcs_info = self.query_vcs_info(frontend, vcs, wanted_fields)
+                except VerHelError as e:
+                    return e.error_code
+
+        # Run Generate.
+        num_success = self.verhel_generate_sources(project_name, desc, vcs_info, build_info)
+
+        fmt = "successfully generated for {}/{} backends"
+        if num_success == len(backends_list):
+            Log.success(fmt.format(num_success, len(backends_list)))
+        else:
+            Log.warn(fmt.format(num_success, len(backends_list)))
+
+        return ExitCodes.SUCCESS
+
+    def delete(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "delete")
+        project_name = args.project
+        projects_file = args.projects_file
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+        
+        Log.info("running delete command")
+
+        try:
+            with self.projects_lock(projects_file, project_name):
+                # Load project.
+                self.load_projects(projects_file, [project_name])
+                _ = self.check_if_project_exists(project_name)
+
+                # Delete project.
+                self.projects.pop(project_name)
+
+                # Update projects file.
+                self.save_projects(projects_file, [project_name])
+        except VerHelError as e:
+            return e.error_code
+
+        Log.success("successfully deleted project '{}'".format(project_name))
+
+        Log.info("delete command finished")
+        return ExitCodes.SUCCESS
+
+    def info(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "info")
+        project_name = args.project
+        projects_file = args.projects_file
+
+        Log.info("running info command")
+
+        # Load project.
+        try:
+            self.load_projects(projects_file, [project_name])
+            desc = self.check_if_project_exists(project_name)
+        except VerHelError as e:
+            return e.error_code
+
+        # Pretty print project description.
+        try:
+            fields = self.listed_fields(args.fields, ProjectDesc.KEYS)
+        except VerHelError as e:
+            return e.error_code
+        if fields is not None:
+            desc = dict((field, desc.get(field)) for field in fields)
+        if args.format == "ndjson":
+            info = json.dumps(desc, default=record_to_json)
+        else:
+            info = json.dumps(desc, indent=4, default=record_to_json)
+        print(info)
+        Log.debug(info)
+
+        Log.success("info command finished")
+        return ExitCodes.SUCCESS
+
+    def validate(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "validate")
+        project_name = args.project
+        projects_file = args.projects_file
+
+        Log.info("running validate command")
+
+        # Load project.
+        try:
+            self.load_projects(projects_file, [project_name])
+            _ = self.check_if_project_exists(project_name)
+            self.validate_project(project_name)
+        except VerHelError as e:
+            return e.error_code
+
+        # Pretty print project description.
+        if not args.quiet:
+            print("OK")
+
+        Log.success("validate command finished")
+        return ExitCodes.SUCCESS
+
+    def get_property(self, desc, property_name):
+        key = self.check_if_name_is_valid(property_name)
+
+        # Backends are special case.
+        if property_name.startswith("backends."):
+            for bk in desc.get("backends"):
+                value = bk.get(key)
+                if value is not None:
+                    return value
+
+            Log.fatal("backend '{}' doesn't exists".format(key))
+            raise VerHelError(ExitCodes.BACKEND_DOESNT_EXISTS)
+        else:
+            return desc.get(key)
+
+    def set_property(self, desc, property_name, new_value):
+        # Returns old and new (converted) value.
+        key = self.check_if_name_is_valid(property_name)
+
+        # Check if key exists and validate type.
+        # Backends are special case.
+        old_value = None
+        if property_name.startswith("backends."):
+            # Check if backend exists.        
+            index = 0
+            backends = desc.get("backends")
+            for bk in backends:
+                v = bk.get(key)
+                if v is not None:
+                    break
+                index = index + 1
+
+            # Add new value or else update.
+            # If new value is null that mean to remove.
+            remove = new_value is None or new_value == "null"
+            if index == len(backends):
+                if not remove:
+                    backends.append({key: str(new_value)})
+            else:
+                if not remove:
+                    old_value = backends[index][key]
+                    backends[index][key] = str(new_value)
+                else:
+                    old_value = backends.pop(index)[key]
+        else:    
+            default = self.default_project()
+            old_value = desc.get(key)
+            if type(default[key]) is int and new_value is not None:
+                try:
+                    converted = int(new_value)
+                except ValueError as e:
+                    Log.fatal(e)
+                    Log.fatal("invalid new value '{}' for property '{}'".format(new_value, key))
+                    raise VerHelError(ExitCodes.INVALID_VALUE)
+                else:
+                    new_value = converted
+
+            # Add/Update value.
+            desc[key] = new_value
+
+        if old_value is None:
+            Log.success("successfully set value for '{}', new value '{}'".format(key, new_value))
+        else:
+            Log.success("successfully set value for '{}', old '{}' new '{}'".format(key, old_value, new_value))
+
+        return old_value, new_value
+
+    def get(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "get")
+        project_name = args.project
+        projects_file = args.projects_file
+        property_name = args.property_name
+
+        Log.info("running get command")
+        
+        # Load project and get value.
+        try:
+            self.check_if_name_is_valid(property_name)
+            self.load_projects(projects_file, [project_name])
+            desc = self.check_if_project_exists(project_name)            
+            value = self.get_property(desc, property_name)
+        except VerHelError as e:
+            return e.error_code
+
+        print(value)
+        Log.success("successfully get value for property {} = '{}'".format(property_name, value))
+
+        Log.info("get command finished")
+        return ExitCodes.SUCCESS
+
+    def set(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "set")
+        project_name = args.project
+        projects_file = args.projects_file
+        property_name = args.property_name
+        new_value = args.new_value
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+
+        Log.info("running set command")
+        
+        try:
+            self.check_if_name_is_valid(property_name)
+            with self.projects_lock(projects_file, project_name):
+                # Load project and set value.
+                self.load_projects(projects_file, [project_name])
+                desc = self.check_if_project_exists(project_name)
+                self.set_property(desc, property_name, new_value)
+
+                # Update projects file.
+                self.save_projects(projects_file, [project_name])
+        except VerHelError as e:
+            return e.error_code
+
+        Log.info("set command finished")
+        return ExitCodes.SUCCESS
+
+    def parse_batch_command(self, line):
+        # NDJSON object {"op": "set", "property": ..., "value": ...} or line
+        # command "set <property> <value>", "get <property>". Json values
+        # are mapped to their json spelling, null unsets the property.
+        if line.startswith("{"):
+            command = json.loads(line)
+            if not isinstance(command, (dict, SparseRecord)):
+                raise ValueError("command must be an object")
+            value = command.get("value")
+            if value is None or type(value) is str:
+                pass
+            elif type(value) in (bool, int, float):
+                value = json.dumps(value)
+            else:
+                raise ValueError("value must be string, number, boolean or null")
+            return command.get("op"), command.get("property"), value
+        else:
+            words = shlex.split(line)
+            if len(words) < 2:
+                raise ValueError("expected '<op> <property> [value]'")
+            return words[0], words[1], " ".join(words[2:])
+
+    def batch(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "batch")
+        project_name = args.project
+        projects_file = args.projects_file
+
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+
+        Log.info("running batch command")
+
+        # All commands are parsed before the project is touched, invalid
+        # line fails the batch without taking the lock.
+        commands = []
+        for line in sys.stdin.read().splitlines():
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+
+            try:
+                op, property_name, value = self.parse_batch_command(line)
+            except ValueError as e:
+                Log.fatal("invalid batch command '{}': {}".format(line, e))
+                return ExitCodes.INVALID_REQUEST
+            if op not in ("get", "set"):
+                Log.fatal("unknown batch operation '{}'".format(op))
+                return ExitCodes.INVALID_REQUEST
+            commands.append((op, property_name, value))
+
+        # Project is loaded and saved once under single lock. First failed
+        # command aborts the batch and nothing is saved.
+        try:
+            with self.projects_lock(projects_file, project_name):
+                self.load_projects(projects_file, [project_name])
+                desc = self.check_if_project_exists(project_name)
+                original = copy.deepcopy(desc)
+
+                for op, property_name, value in commands:
+                    result = {"op": op, "property": property_name}
+                    try:
+                        if op == "get":
+                            result["value"] = self.get_property(desc, property_name)
+                        else:
+                            result["old"], result["value"] = self.set_property(desc, property_name, value)
+                    except VerHelError as e:
+                        result["ret"] = e.error_code
+                        print(json.dumps(result, default=record_to_json), flush=True)
+                        Log.fatal("batch aborted, nothing saved")
+                        raise
+
+                    result["ret"] = ExitCodes.SUCCESS
+                    print(json.dumps(result, default=record_to_json), flush=True)
+
+                # Save only if anything changed.
+                if desc != original:
+                    self.save_projects(projects_file, [project_name])
+        except VerHelError as e:
+            return e.error_code
+
+        Log.info("batch command finished")
+        return ExitCodes.SUCCESS
+
+    def listed_fields(self, fields, known_fields):
+        # Comma separated fields, None if all fields are listed. Only top
+        # level keys can be listed, unknown fields would print as null.
+        if fields is None:
+            return None
+
+        fields = [field.strip() for field in fields.split(",") if len(field.strip()) > 0]
+        for field in fields:
+            if field not in known_fields:
+                Log.fatal("'{}' is not a valid field".format(field))
+                raise VerHelError(ExitCodes.INVALID_KEY)
+        return fields
+
+    def print_entry(self, name, entry, fields):
+        # Entry as single json line, flushed so reader gets it right away.
+        # Name of entry is never overwritten by its fields.
+        record = {"name": name}
+        for field, value in (entry.items() if fields is None else ((field, entry.get(field)) for field in fields)):
+            if field != "name":
+                record[field] = value
+        print(json.dumps(record, default=record_to_json), flush=True)
+
+    def list_catalog(self, catalog, args):
+        # Catalog entries are decoded only if they are printed with fields,
+        # which are checked against keys of printed entries.
+        names = [name for name in catalog if args.match is None or fnmatch.fnmatchcase(name, args.match)]
+        if args.format == "ndjson":
+            known_fields = set()
+            if args.fields is not None:
+                for name in names:
+                    known_fields.update(catalog[name].keys())
+            fields = self.listed_fields(args.fields, known_fields)
+            for name in names:
+                self.print_entry(name, catalog[name], fields)
+        else:
+            print(names)
+
+    def list_projects(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "list_projects")
+        projects_file = args.projects_file
+
+        Log.info("running list projects command")
+
+        # Stream matching projects, or load them and print names.
+        try:
+            if args.format == "ndjson":
+                fields = self.listed_fields(args.fields, ProjectDesc.KEYS)
+                for name, desc in self.iter_projects(projects_file, args.match):
+                    self.print_entry(name, desc, fields)
+            else:
+                self.load_projects(projects_file)
+                print([name for name in self.projects.keys() if args.match is None or fnmatch.fnmatchcase(name, args.match)])
+        except VerHelError as e:
+            return e.error_code
+        except (OSError, ValueError, AttributeError) as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to load projects")
+            return ExitCodes.FAILED_TO_LOAD_PROJECTS
+
+        Log.success("list projects command finished")
+        return ExitCodes.SUCCESS  
+        
+    def list_frontends(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "list_frontends")
+        frontends_file = args.frontends_file
+
+        Log.info("running list frontends command")
+
+        # Load frontends and print them.
+        try:
+            self.load_frontends(frontends_file)
+            self.list_catalog(self.frontends, args)
+        except VerHelError as e:
+            return e.error_code
+
+        Log.success("list frontends command finished")
+        return ExitCodes.SUCCESS  
+        
+    def list_backends(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "list_backends")
+        backends_file = args.backends_file
+
+        Log.info("running list backends command")
+
+        # Load backends and print them.
+        try:
+            self.load_backends(backends_file)
+            self.list_catalog(self.backends, args)
+        except VerHelError as e:
+            return e.error_code
+
+        Log.success("list backends command finished")
+        return ExitCodes.SUCCESS
+
+    def serve_request(self, request):
+        # Server doesn't enter directory of the request, it's process wide
+        # state. Paths of request are resolved against it instead.
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                if type(request) is not dict or type(request.get("argv")) is not list:
+                    raise ValueError("request must be an object with 'argv' list")
+                if type(request.get("cwd")) is not str or not os.path.isabs(request.get("cwd")):
+                    raise ValueError("request must have absolute 'cwd'")
+
+                self.request_cwd = request.get("cwd")
+                args = self.arg_parser.parse_args(request.get("argv"))
+                for name in self.PATH_ARGUMENTS:
+                    if getattr(args, name, None) is not None:
+                        setattr(args, name, self.resolve_path(getattr(args, name)))
+
+                func = getattr(args, "func", None)
+                if func is None or func.__name__ not in self.SERVED_COMMANDS:
+                    Log.error("command is not supported by server, supported: {}".format(self.SERVED_COMMANDS))
+                    ret = ExitCodes.INVALID_REQUEST
+                else:
+                    ret = func(args)
+            except SystemExit as e:
+                # Argparse exits on invalid arguments.
+                ret = e.code if type(e.code) is int else ExitCodes.INVALID_REQUEST
+            except (ValueError, OSError) as e:
+                Log.error("invalid request: {}".format(e))
+                ret = ExitCodes.INVALID_REQUEST
+            except Exception as e:
+                Log.error("request failed: {}".format(e))
+                ret = ExitCodes.SERVER_FAILED
+            finally:
+                self.request_cwd = None
+
+        return {"ret": ret, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def client(self, socket_path, argv):
+        request = {"argv": argv, "cwd": os.getcwd()}
+
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+                sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+                with sock.makefile("r", encoding="utf-8") as f:
+                    response = json.loads(f.readline())
+        except (AttributeError, OSError, ValueError) as e:
+            Log.debug("failed to query server '{}': {}".format(socket_path, e))
+            return None
+
+        sys.stdout.write(response.get("stdout", ""))
+        sys.stderr.write(response.get("stderr", ""))
+        return response.get("ret", ExitCodes.SERVER_FAILED)
+
+    def serve(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "serve")
+        socket_path = os.path.abspath(args.socket)
+
+        Log.info("running serve command")
+
+        if not hasattr(socketserver, "UnixStreamServer"):
+            Log.fatal("unix sockets are not supported on this platform")
+            return ExitCodes.SERVER_FAILED
+
+        # Remove socket left by server that wasn't shut down cleanly.
+        if os.path.exists(socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(socket_path)
+            except OSError:
+                Log.info("removing stale socket '{}'".format(socket_path))
+                os.unlink(socket_path)
+            else:
+                Log.fatal("server is already listening on '{}'".format(socket_path))
+                return ExitCodes.SERVER_FAILED
+
+        self.keep_warm = True
+        self.arg_parser = build_parser(self)
+
+        # Only owner can connect, commands run with permissions of server.
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.UnixStreamServer(socket_path, VerHelRequestHandler)
+        except OSError as e:
+            Log.fatal("failed to listen on '{}'".format(socket_path))
+            Log.error("{}".format(e))
+            return ExitCodes.SERVER_FAILED
+        finally:
+            os.umask(umask)
+
+        server.verhel = self
+        Log.success("listening on '{}'".format(socket_path))
+
+        # Coprocesses of repositories that are not used anymore are closed.
+        server.service_actions = lambda: self.close_coprocesses(self.COPROCESS_IDLE_TIMEOUT)
+
+        # Shutdown cleanly when stopped by service manager.
+        def on_terminate(signum, frame):
+            raise KeyboardInterrupt()
+        signal.signal(signal.SIGTERM, on_terminate)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            Log.info("interrupted, shutting down server")
+        finally:
+            server.server_close()
+            os.unlink(socket_path)
+            self.close_coprocesses()
+
+        Log.success("serve command finished")
+        return ExitCodes.SUCCESS
+
+    def embed_catalog(self, source, kind, catalog):
+        # Replace builder region of the script with catalog as python
+        # literal, so it's not parsed as json on every run.
+        marker = "# $$_BUILDER_{}_DESC_{}_HERE_$$ #\n"
+        start = marker.format(kind, "START")
+        end = marker.format(kind, "END")
+        begin = source.index(start) + len(start)
+        finish = source.index(end, begin)
+
+        literal = pprint.pformat(catalog, indent=4, width=100, sort_dicts=False)
+        if ast.literal_eval(literal) != catalog:
+            raise ValueError("{} catalog can't be embedded as literal".format(kind.lower()))
+
+        return source[:begin] + "{}_DESC = {}\n".format(kind, literal) + source[finish:]
+
+    def update(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "update")
+        backends_file = args.backends_file
+        frontends_file = args.frontends_file
+        script = os.path.abspath(__file__)
+        output = os.path.abspath(args.output) if args.output is not None else script
+
+        Log.info("running update command")
+
+        # Load and validate catalogs, built-in ones if file is not given.
+        # Catalog entries are validated when accessed.
+        try:
+            self.load_frontends(frontends_file)
+            self.load_backends(backends_file)
+            frontends = dict(self.frontends.items())
+            backends = dict(self.backends.items())
+        except VerHelError as e:
+            return e.error_code
+
+        # Rewrite builder regions.
+        try:
+            with open(script, encoding="utf-8") as f:
+                source = f.read()
+            mode = os.stat(script).st_mode
+
+            source = self.embed_catalog(source, "FRONTENDS", frontends)
+            source = self.embed_catalog(source, "BACKENDS", backends)
+            compile(source, output, "exec")
+
+            write_file_atomic(output, source)
+            os.chmod(output, mode & 0o7777)
+        except (OSError, ValueError, SyntaxError) as e:
+            Log.error("{}".format(e))
+            Log.fatal("failed to update '{}'".format(output))
+            return ExitCodes.INVALID_CATALOG
+
+        Log.success("embedded {} frontends and {} backends into '{}'".format(len(self.frontends), len(self.backends), output))
+        Log.success("update command finished")
+        return ExitCodes.SUCCESS
+
+    def hook_block(self, hook_name, projects_file, generate_argvs):
+        # Block of shell script appended to hook. Generate runs detached
+        # in background, so git doesn't wait for it, and under project lock.
+        marker = "verhel {}".format(projects_file)
+        if generate_argvs is None:
+            return marker, None
+
+        cmds = " ; ".join(" ".join(shlex.quote(arg) for arg in argv) for argv in generate_argvs)
+        line = "( cd {} && {{ {} ; }} ) </dev/null >/dev/null 2>&1 &".format(shlex.quote(os.getcwd()), cmds)
+
+        # Checkout of files doesn't move HEAD.
+        if hook_name == "post-checkout":
+            line = "[ \"$3\" = \"0\" ] || " + line
+
+        return marker, "\n".join([
+            "# >>> {} >>>".format(marker),
+            "# Installed by 'verhel install-hooks', regenerates sources when HEAD moves.",
+            line,
+            "# <<< {} <<<".format(marker)
+            ])
+
+    def install_hook(self, hook_file, marker, block):
+        # Replace block with same marker or append it, rest of the hook is
+        # kept. Block is removed if it's None.
+        try:
+            with open(hook_file, encoding="utf-8") as f:
+                content = f.read()
+            mode = os.stat(hook_file).st_mode & 0o7777
+        except FileNotFoundError:
+            content = None
+            mode = 0o755
+
+        lines = [] if content is None else content.splitlines()
+        begin = "# >>> {} >>>".format(marker)
+        end = "# <<< {} <<<".format(marker)
+        if begin in lines and end in lines[lines.index(begin):]:
+            first = lines.index(begin)
+            last = lines.index(end, first)
+            lines[first:last + 1] = [] if block is None else block.split("\n")
+        elif block is not None:
+            if len(lines) == 0:
+                lines = ["#!/bin/sh"]
+            elif any(line.strip().startswith("exit") for line in lines[-3:]):
+                Log.warn("hook '{}' may exit before verhel block".format(hook_file))
+            lines.append(block)
+
+        if block is None and all(len(line.strip()) == 0 or line.startswith("#!") for line in lines):
+            if content is not None:
+                os.unlink(hook_file)
+                Log.success("removed hook '{}'".format(hook_file))
+            return
+
+        new_content = "\n".join(lines) + "\n"
+        if new_content == content:
+            Log.info("hook '{}' is up to date".format(hook_file))
+            return
+
+        pathlib.Path(hook_file).parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(hook_file, new_content)
+        os.chmod(hook_file, mode | 0o111)
+        Log.success("{} hook '{}'".format("removed verhel from" if block is None else "installed", hook_file))
+
+    def install_hooks(self, args):
+        # Command line arguments.
+        self.process_arguments(args, "install-hooks")
+        project_name = args.project
+        projects_file = args.projects_file
+        glob_desc_name = args.global_desc_name
+
+        if projects_file is None:
+            projects_file = self.default_projects_file()
+        projects_file = os.path.abspath(projects_file)
+
+        Log.info("running install-hooks command")
+
+        if not args.all and project_name is None:
+            Log.fatal("project name or --all is required")
+            return ExitCodes.PROJECT_DOESNT_EXISTS
+
+        # Find hooks directory of repository of each project.
+        cwd = os.getcwd()
+        hooks_directories = {}
+        try:
+            if args.all:
+                self.load_projects(projects_file)
+                names = [name for name in self.projects.keys()
+                    if name != self.GLOBAL_DESC_NAME and name != glob_desc_name]
+            else:
+                self.load_projects(projects_file, [project_name, glob_desc_name or self.GLOBAL_DESC_NAME])
+                self.check_if_project_exists(project_name)
+                names = [project_name]
+
+            for name in names:
+                desc = self.resolve_project(name, glob_desc_name)
+                if desc.get("frontend") != "git":
+                    Log.warn("project '{}' doesn't use git frontend, skipping".format(name))
+                    continue
+
+                self.cd_into_project_directory(desc)
+                try:
+                    ret, output = self.run_cmd("git rev-parse --git-path hooks")
+                except Exception as e:
+                    Log.error("{}".format(e))
+                    ret = None
+                if ret != 0:
+                    Log.fatal("project '{}' is not in git repository".format(name))
+                    raise VerHelError(ExitCodes.REPO_DOESNT_EXISTS)
+
+                hooks_directory = os.path.abspath(output.strip())
+                hooks_directories.setdefault(hooks_directory, []).append(name)
+                os.chdir(cwd)
+        except VerHelError as e:
+            return e.error_code
+        finally:
+            os.chdir(cwd)
+
+        # Same options as build uses, so stamp of hook run matches.
+        options = ["--projects-file", projects_file]
+        for option, value in [("--frontends-file", args.frontends_file), ("--backends-file", args.backends_file)]:
+            if value is not None:
+                options.extend([option, os.path.abspath(value)])
+        if glob_desc_name is not None:
+            options.extend(["--global-desc-name", glob_desc_name])
+        if args.emit_default:
+            options.append("--emit-default")
+
+        generate = [sys.executable, entry_script(), "--quiet", "generate"]
+        for hooks_directory, names in hooks_directories.items():
+            if args.all:
+                argvs = [generate + ["--all"] + options]
+            else:
+                argvs = [generate + [name] + options for name in names]
+
+            for hook_name in self.HOOK_NAMES:
+                marker, block = self.hook_block(hook_name, projects_file, None if args.remove else argvs)
+                try:
+                    self.install_hook(os.path.join(hooks_directory, hook_name), marker, block)
+                except OSError as e:
+                    Log.error("{}".format(e))
+                    Log.fatal("failed to install hook '{}'".format(hook_name))
+                    return ExitCodes.FAILED_TO_INSTALL_HOOKS
+
+        Log.info("install-hooks command finished")
+        return ExitCodes.SUCCESS
+
+# ============================================================================ #
+# Server
+# ============================================================================ #
+class VerHelRequestHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, one JSON response per line.
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"ret": ExitCodes.INVALID_REQUEST, "stdout": "", "stderr": "{}\n".format(e)}
+            else:
+                response = self.server.verhel.serve_request(request)
+
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+def strip_server_argument(argv):
+    stripped = []
+    skip_next = False
+    for arg in argv:
+        if skip_next:
+            skip_next = False
+        elif arg == "--server":
+            skip_next = True
+        elif not arg.startswith("--server="):
+            stripped.append(arg)
+
+    return stripped
+
+# ============================================================================ #
+# Main function
+# ============================================================================ #
+def add_listing_arguments(subparser, match=True):
+    subparser.add_argument("--format", choices=["text", "ndjson"], default="text",
+                           help="output format, ndjson prints one json object per line (default: text)")
+    subparser.add_argument("--fields", type=str, metavar="A,B,C", help="comma separated top level fields to print, e.g. version.major (not backends.NAME)")
+    if match:
+        subparser.add_argument("--match", type=str, metavar="GLOB", help="print only entries with name matching GLOB")
+
+def build_parser(verhel):
+    parser = argparse.ArgumentParser()
+    gp_verbosity = parser.add_mutually_exclusive_group()
+    gp_verbosity.add_argument("--quiet", action="store_true", help="no console output")
+    gp_verbosity.add_argument("--verbose", type=int, choices=[0, 1, 2, 3], default=0,
+                              help="show more info about what is happening")
+    parser.add_argument("--color-output", action="store_true", help="color the console output")
+    parser.add_argument("--server", type=str, metavar="SOCKET",
+                        help="send command to server listening on SOCKET (see serve command)")
+    subparsers = parser.add_subparsers(title="Commands")
+
+    sp_init = subparsers.add_parser("init")
+    sp_init.add_argument("project", help="name of project to init")
+    sp_init.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_init.add_argument("--wait-timeout", type=float, metavar="SECONDS",
+                         help="how long to wait for lock of projects file (default: wait forever)")
+    sp_init.set_defaults(func=verhel.init)
+
+    sp_generate = subparsers.add_parser(
+        "generate",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            This will generate source code for specific project.
+            Run before building task.
+            """
+            )
+        )
+    sp_generate.add_argument("project", nargs="?", help="name of project to update")
+    sp_generate.add_argument("--all", action="store_true", help="generate all projects from projects file")
+    sp_generate.add_argument("--discover", type=str, metavar="ROOT",
+                             help="generate all projects from projects files found under ROOT")
+    sp_generate.add_argument("--max-depth", type=int, default=8,
+                             help="how deep --discover looks for projects files (default: 8)")
+    sp_generate.add_argument("--prune", type=str, action="append", metavar="PATTERN",
+                             help="skip directories matching gitignore style PATTERN with --discover")
+    sp_generate.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_generate.add_argument("--frontends-file", type=str, help="path to custom fronteds description file or directory")
+    sp_generate.add_argument("--backends-file", type=str, help="path to custom backends description file or directory")
+    sp_generate.add_argument("--global-desc-name", type=str, help="name of global description project")
+    sp_generate.add_argument("--vcs-deadline", type=int, metavar="MS",
+                             help="overall time limit for vcs commands, missing values are taken from cache or null")
+    sp_generate.add_argument("--vcs-info-from", type=str, metavar="SNAPSHOT",
+                             help="use vcs and build info from snapshot instead of running frontend (see snapshot command)")
+    sp_generate.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                             help="number of parallel workers (default: number of cpus)")
+    sp_generate.add_argument("--fsync", action="store_true",
+                             help="flush written outputs to disk before finishing")
+    sp_generate.add_argument("--metrics-file", type=str, metavar="PATH",
+                             help="write Prometheus text format metrics of the run to PATH")
+    sp_generate.add_argument("--check-stamp", action="store_true",
+                             help="skip project if it was generated from the same inputs (see install-hooks command)")
+    sp_generate.add_argument("--emit-default", action="store_true", 
+                             help="emit default value if description property is null")
+    sp_generate.add_argument("--fatal-if-backend-not-impl", action="store_false", 
+                             help=textwrap.dedent("""
+                                stop execution if backend not implemented
+                                (by default it will generate source with
+                                backends that are implemented) 
+                                """
+                                )
+                             )
+    sp_generate.set_defaults(func=verhel.generate)
+
+    sp_snapshot = subparsers.add_parser(
+        "snapshot",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            Save vcs and build info of project to file, so generate can be
+            run with --vcs-info-from where vcs or repository is not available.
+            """
+            )
+        )
+    sp_snapshot.add_argument("project", help="name of project to snapshot")
+    sp_snapshot.add_argument("-o", "--output", type=str, required=True, help="path to snapshot file")
+    sp_snapshot.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_snapshot.add_argument("--frontends-file", type=str, help="path to custom fronteds description file or directory")
+    sp_snapshot.add_argument("--global-desc-name", type=str, help="name of global description project")
+    sp_snapshot.set_defaults(func=verhel.snapshot)
+
+    sp_delete = subparsers.add_parser("delete")
+    sp_delete.add_argument("project", help="name of project to delete")
+    sp_delete.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_delete.add_argument("--wait-timeout", type=float, metavar="SECONDS",
+                           help="how long to wait for lock of projects file (default: wait forever)")
+    sp_delete.set_defaults(func=verhel.delete)
+
+    sp_info = subparsers.add_parser("info")
+    sp_info.add_argument("project", help="name of project to display info")
+    sp_info.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    add_listing_arguments(sp_info, False)
+    sp_info.set_defaults(func=verhel.info)
+
+    sp_validate = subparsers.add_parser("validate")
+    sp_validate.add_argument("project", help="name of project to display validate")
+    sp_validate.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_validate.set_defaults(func=verhel.validate)
+
+    sp_get = subparsers.add_parser("get")
+    sp_get.add_argument("project", help="name of project to get value from")
+    sp_get.add_argument("property_name", help="name of property to get value")
+    sp_get.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_get.set_defaults(func=verhel.get)
+
+    sp_set = subparsers.add_parser("set")
+    sp_set.add_argument("project", help="name of project to set value to")
+    sp_set.add_argument("property_name", help="name of property to get value")
+    sp_set.add_argument("new_value", help="new value to be set")
+    sp_set.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_set.add_argument("--wait-timeout", type=float, metavar="SECONDS",
+                        help="how long to wait for lock of projects file (default: wait forever)")
+    sp_set.set_defaults(func=verhel.set)
+
+    sp_batch = subparsers.add_parser(
+        "batch",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            Read get and set commands from stdin and apply them to project,
+            which is loaded and saved once. Commands are JSON lines
+            {"op": "set", "property": "version.patch", "value": 3} or lines
+            "set version.patch 3", "get version.patch". JSON null unsets the
+            property. Result of each command is printed as JSON line. First
+            failed command aborts the batch and nothing is saved.
+            """
+            )
+        )
+    sp_batch.add_argument("project", help="name of project to get and set values")
+    sp_batch.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_batch.add_argument("--wait-timeout", type=float, metavar="SECONDS",
+                          help="how long to wait for lock of projects file (default: wait forever)")
+    sp_batch.set_defaults(func=verhel.batch)
+
+    sp_list_proj = subparsers.add_parser("list_projects")
+    sp_list_proj.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    add_listing_arguments(sp_list_proj)
+    sp_list_proj.set_defaults(func=verhel.list_projects)
+
+    sp_list_front = subparsers.add_parser("list_frontends")
+    sp_list_front.add_argument("--frontends-file", type=str, help="path to custom fronteds description file or directory")
+    add_listing_arguments(sp_list_front)
+    sp_list_front.set_defaults(func=verhel.list_frontends)
+
+    sp_list_back = subparsers.add_parser("list_backends")
+    sp_list_back.add_argument("--backends-file", type=str, help="path to custom backends description file or directory")
+    add_listing_arguments(sp_list_back)
+    sp_list_back.set_defaults(func=verhel.list_backends)
+
+    sp_serve = subparsers.add_parser(
+        "serve",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            Run server that keeps projects, catalogs and vcs info in memory
+            and answers generate, get, set, info and validate commands
+            send with --server option.
+            """
+            )
+        )
+    sp_serve.add_argument("--socket", type=str, required=True, help="path to unix socket to listen on")
+    sp_serve.set_defaults(func=verhel.serve)
+
+    sp_update = subparsers.add_parser(
+        "update",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            Validate frontends and backends catalogs and embed them into
+            the script as python literals, so they are not parsed on every
+            run. Built-in catalogs are recompiled if file is not given.
+            """
+            )
+        )
+    sp_update.add_argument("--frontends-file", type=str, help="path to fronteds description file to embed")
+    sp_update.add_argument("--backends-file", type=str, help="path to backends description file to embed")
+    sp_update.add_argument("-o", "--output", type=str, help="path to updated script (default: update in place)")
+    sp_update.set_defaults(func=verhel.update)
+
+    sp_install_hooks = subparsers.add_parser(
+        "install-hooks",
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+        description = textwrap.dedent("""
+            Install git hooks (post-checkout, post-commit, post-merge and
+            post-rewrite) which generate project in background when HEAD
+            moves. Builds can then run generate with --check-stamp.
+            Existing hooks are kept, verhel block is appended to them.
+            """
+            )
+        )
+    sp_install_hooks.add_argument("project", nargs="?", help="name of project to generate from hooks")
+    sp_install_hooks.add_argument("--all", action="store_true", help="generate all projects from projects file")
+    sp_install_hooks.add_argument("--projects-file", type=str, help="path to custom projects description file or directory")
+    sp_install_hooks.add_argument("--frontends-file", type=str, help="path to custom fronteds description file or directory")
+    sp_install_hooks.add_argument("--backends-file", type=str, help="path to custom backends description file or directory")
+    sp_install_hooks.add_argument("--global-desc-name", type=str, help="name of global description project")
+    sp_install_hooks.add_argument("--emit-default", action="store_true",
+                                  help="emit default value if description property is null")
+    sp_install_hooks.add_argument("--remove", action="store_true", help="remove verhel block from hooks")
+    sp_install_hooks.set_defaults(func=verhel.install_hooks)
+
+    return parser
+
+def main():    
+    verhel = VerHel()
+
+    # Parse command line arguments
+    parser = build_parser(verhel)
+    args = parser.parse_args()
+
+    # Thin client mode, fallback to running command locally.
+    ret = None
+    if args.server is not None and args.func.__name__ in verhel.SERVED_COMMANDS:
+        ret = verhel.client(args.server, strip_server_argument(sys.argv[1:]))
+        if ret is None:
+            Log.warn("server '{}' is not available, running locally".format(args.server))
+
+    if ret is None:
+        try:
+            ret = args.func(args)
+        finally:
+            verhel.close_coprocesses()
+
+    sys.exit(ret)
+
+if __name__ == "__main__":
+    main()